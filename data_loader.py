@@ -0,0 +1,494 @@
+import os
+import time
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+import pandas as pd
+from pandas.api.types import union_categoricals
+import streamlit as st
+from streamlit_gsheets import GSheetsConnection
+from tenacity import (retry, retry_if_not_exception_type, stop_after_attempt,
+                      wait_random_exponential)
+from translations import lang_content as translations
+from snapshots import save_snapshot, load_snapshot, frame_hash
+
+# Default seconds between two refreshes of a sheet from Google Sheets.
+# Override with the UMD_DATA_TTL environment variable.
+DATA_TTL = int(os.environ.get("UMD_DATA_TTL", 600))
+
+# Seconds to wait before trying again after a failed refresh
+RETRY_DELAY = 60
+
+# Maximum number of sheets read from Google Sheets at the same time
+FETCH_WORKERS = 4
+
+# Attempts per read before giving up, with jittered exponential backoff
+FETCH_ATTEMPTS = 4
+
+# Sheets that only ever grow (form responses): refreshes read only the new rows
+APPEND_ONLY = {"nico"}
+
+# Known rows read again on every incremental refresh to detect edits
+SYNC_OVERLAP = 20
+
+# Seconds after which an append-only sheet is read in full anyway, to pick up
+# edits to rows older than the overlap
+FULL_SYNC_INTERVAL = 12 * DATA_TTL
+
+# Read options for every Google Sheets source, keyed by connection name
+SHEETS = {
+    # Field work reports (form responses)
+    "nico": dict(
+        usecols=[1, 2, 3, 5, 6, 54],
+        names=['content', 'position(id)', 'type', 'team', 'date', 'photos'],
+        parse_dates=['date'],
+        dayfirst=True,
+        header=0,
+    ),
+    # Data acquisition issues
+    "belu": dict(
+        usecols=[0, 2, 3, 6, 9, 11, 12],
+        names=['position', 'modules', 'date_report', 'summary', 'team', 'status', 'report'],
+        parse_dates=['date_report'],
+        dayfirst=True,
+        header=0,
+    ),
+    # Stock - Assembly progress
+    "stats_stock": dict(
+        usecols=[0, 1],
+        names=['date', 'UMD_number'],
+        header=None,
+        dayfirst=True,
+        skiprows=9,
+    ),
+    # Installation history
+    "stats_historial": dict(
+        usecols=[2, 3, 6, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 31, 32, 33],
+        names=['position', 'id', 'install_date',
+               'id_m101', 'RotationAngle_m101', 'RadioDistance_m101', 'PositionAngle_m101',
+               'id_m102', 'RotationAngle_m102', 'RadioDistance_m102', 'PositionAngle_m102',
+               'id_m103', 'RotationAngle_m103', 'RadioDistance_m103', 'PositionAngle_m103',
+               'ekit_m101', 'ekit_m102', 'ekit_m103'],
+        header=None,
+        skiprows=7,
+    ),
+    # Assembly details of each UMD (columns A and C)
+    "umd_details": dict(
+        usecols=[0, 2],
+    ),
+}
+
+# Seconds between background refreshes of each sheet
+REFRESH_INTERVALS = {
+    "nico": DATA_TTL,
+    "belu": DATA_TTL,
+    "stats_stock": 6 * DATA_TTL,
+    "stats_historial": 3 * DATA_TTL,
+    "umd_details": 6 * DATA_TTL,
+}
+
+MODULE_COLUMNS = ['id_m101', 'id_m102', 'id_m103']
+
+
+def is_valid_module(x):
+    """Count only valid modules (starting with "M-")"""
+    return isinstance(x, str) and x.startswith('M-')
+
+
+def categorize(df, columns):
+    """Store low-cardinality text columns as categoricals with sorted categories."""
+    for col in columns:
+        values = df[col]
+        df[col] = values.where(values.isna(), values.astype(str)).astype('category')
+    return df
+
+
+def clean_field_work(df):
+    # Extract name and id from position(id) column
+    df[['name', 'id']] = df['position(id)'].str.extract(r'([\w\s.]+)\s*\(id=(\d+)\)', expand=True)
+
+    # Dates stay as datetime64, they are formatted only when displayed
+    df['date'] = pd.to_datetime(df['date'], errors='coerce', dayfirst=True)
+
+    df = df.drop(columns=['position(id)']).reset_index(drop=True)
+    return categorize(df, ['name', 'type', 'team'])
+
+
+def clean_acquisitions(df):
+    df = df.rename(columns={'date_report': 'date'})
+    df['date'] = pd.to_datetime(df['date'], errors='coerce', dayfirst=True)
+    return categorize(df.reset_index(drop=True), ['position', 'status', 'team'])
+
+
+def clean_stock(df):
+    df = df.dropna()  # Remove rows without cumulative numbers
+    df['UMD_number'] = df['UMD_number'].astype(int)
+    df['date'] = pd.to_datetime(df['date'], format="%d/%m/%y")
+    return df
+
+
+def clean_historial(df):
+    df = df[~df["install_date"].str.contains("-", na=False)]  # Remove not installed
+    df['install_date'] = pd.to_datetime(df['install_date'], dayfirst=True, errors='coerce')
+    df = df.dropna(subset=['install_date'])  # Remove rows without install date
+    df['id'] = df['id'].astype(int)
+
+    # Count valid modules per installation
+    for col in MODULE_COLUMNS:
+        df[f'{col}_valid'] = df[col].apply(is_valid_module)
+    df['modules_installed'] = df[[f'{col}_valid' for col in MODULE_COLUMNS]].sum(axis=1)
+
+    return df.sort_values(by='install_date', kind='stable')
+
+
+def clean_umd_details(df):
+    df.columns = ['UMD_ID', 'Details']
+    return df
+
+
+CLEANERS = {
+    "nico": clean_field_work,
+    "belu": clean_acquisitions,
+    "stats_stock": clean_stock,
+    "stats_historial": clean_historial,
+    "umd_details": clean_umd_details,
+}
+
+
+def read_sheet(name, **options):
+    """Read the raw frame of a sheet straight from Google Sheets."""
+    conn = st.connection(name, type=GSheetsConnection)
+    # ttl=0 bypasses the connection cache, freshness is handled by the prefetcher
+    return conn.read(ttl=0, **(options or SHEETS[name]))
+
+
+# Per-source counters: hits (served from memory), fetches, joins (shared an
+# in-flight fetch) and retries
+_stats = defaultdict(Counter)
+_inflight = {}
+_flight_lock = threading.Lock()
+
+
+def _count(name, counter):
+    with _flight_lock:
+        _stats[name][counter] += 1
+
+
+def fetch_stats():
+    """Return the hit/fetch/join/retry counters of every source."""
+    with _flight_lock:
+        return {name: dict(counters) for name, counters in _stats.items()}
+
+
+@retry(
+    # Data errors (parsing, missing columns) will not go away by retrying
+    retry=retry_if_not_exception_type((ValueError, KeyError, TypeError)),
+    wait=wait_random_exponential(multiplier=1, max=30),
+    stop=stop_after_attempt(FETCH_ATTEMPTS),
+    before_sleep=lambda retry_state: _count(retry_state.args[0], 'retries'),
+    reraise=True,
+)
+def _read_with_retry(name, options):
+    return read_sheet(name, **options)
+
+
+def _coalesced_read(name, options):
+    """
+    Read a sheet, sharing a single in-flight fetch between all concurrent
+    requests for the same (connection, columns, skiprows).
+    """
+    key = (name, tuple(options.get('usecols') or ()), options.get('skiprows'))
+    with _flight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+
+    if not leader:
+        _count(name, 'joins')
+        # Cleaning modifies frames in place, every caller gets its own copy
+        return future.result().copy()
+
+    _count(name, 'fetches')
+    try:
+        df = _read_with_retry(name, options)
+        # Joiners copy from a private frame, not the one the leader cleans
+        future.set_result(df.copy())
+        return df
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _flight_lock:
+            del _inflight[key]
+
+
+# Shared pool for Google Sheets reads, bounding concurrent requests
+_fetch_pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="sheet-fetch")
+
+
+def _timed_read(name, options):
+    start = time.perf_counter()
+    try:
+        return _coalesced_read(name, options), None, time.perf_counter() - start
+    except Exception as e:
+        return None, e, time.perf_counter() - start
+
+
+def fetch_sheets(specs):
+    """
+    Read several sheets concurrently.
+    specs maps each connection name to its read options. Returns (frames, report):
+    frames maps each name read successfully to its raw frame, report maps every
+    name to its fetch time in seconds and error (None on success).
+    """
+    futures = {name: _fetch_pool.submit(_timed_read, name, options) for name, options in specs.items()}
+    frames, report = {}, {}
+    for name, future in futures.items():
+        df, error, seconds = future.result()
+        if error is None:
+            frames[name] = df
+        report[name] = {'seconds': seconds, 'error': error}
+    return frames, report
+
+
+# Last good frame and metadata of every sheet, shared by all sessions.
+# Entries are replaced as a whole, never modified in place.
+_lock = threading.Lock()
+_frames = {}
+_refreshing = set()
+
+# Time of the last failed fetch of sheets that have no frame yet
+_failed_at = {}
+
+
+def next_refresh(name):
+    """
+    Time at which a sheet is due for a refresh: its own interval after the last
+    attempt, or RETRY_DELAY after a failed one (also for sheets that never
+    loaded). Sheets never tried are due now.
+    """
+    with _lock:
+        entry = _frames.get(name)
+        failed_at = _failed_at.get(name)
+    if entry is None:
+        return 0 if failed_at is None else failed_at + RETRY_DELAY
+    meta = entry[1]
+    delay = RETRY_DELAY if meta.get('error') else REFRESH_INTERVALS.get(name, DATA_TTL)
+    return meta.get('checked_at', meta['fetched_at']) + delay
+
+
+def _tail_sync(name):
+    """
+    For an append-only sheet with a cached copy, return (start, cached): the
+    sheet is read again from row `start`, which includes the last SYNC_OVERLAP
+    known rows used to detect edits. None when a full read is needed.
+    """
+    if name not in APPEND_ONLY:
+        return None
+    with _lock:
+        entry = _frames.get(name)
+    if entry is None:
+        return None
+    cached, meta = entry
+    if time.time() - meta.get('full_sync_at', 0) > FULL_SYNC_INTERVAL:
+        return None
+    return max(len(cached) - SYNC_OVERLAP, 0), cached
+
+
+def _read_options(name, tail):
+    if tail is None:
+        return SHEETS[name]
+    start, _ = tail
+    return {**SHEETS[name], 'skiprows': range(1, start + 1)}  # Keep the header row
+
+
+def _row_fingerprint(df):
+    # Snapshots read missing values back as None instead of NaN, hash them alike
+    return frame_hash(df.astype(object).where(df.notna(), '').astype(str))
+
+
+def _sync(name, raw, tail):
+    """
+    Clean a fetched frame. For a tail read, append the new rows to the cached
+    copy; returns None if the already known rows changed and a full read is needed.
+    """
+    df = CLEANERS[name](raw)
+    if tail is None:
+        return df
+
+    start, cached = tail
+    known = cached.iloc[start:]
+    if len(df) < len(known) or _row_fingerprint(df.iloc[:len(known)]) != _row_fingerprint(known):
+        return None
+    if len(df) == len(known):
+        return cached
+    return _append_rows(cached, df.iloc[len(known):])
+
+
+def _append_rows(cached, new_rows):
+    """Append rows to a frame, merging the categories of categorical columns."""
+    merged = pd.concat([cached, new_rows], ignore_index=True)
+    for col in cached.columns:
+        if isinstance(cached[col].dtype, pd.CategoricalDtype):
+            merged[col] = union_categoricals([cached[col], new_rows[col]], sort_categories=True)
+    return merged
+
+
+def _publish(name, df, seconds, full_sync):
+    now = time.time()
+    with _lock:
+        previous = _frames.get(name, (None, {}))[1]
+    meta = {'fetched_at': now, 'checked_at': now, 'hash': frame_hash(df), 'rows': len(df),
+            'fetch_seconds': seconds,
+            'full_sync_at': now if full_sync else previous.get('full_sync_at', 0)}
+    with _lock:
+        _frames[name] = (df, meta)
+        _failed_at.pop(name, None)
+    try:
+        save_snapshot(name, df, meta)
+    except Exception as e:
+        print(f"Error saving snapshot {name}: {str(e)}")
+
+
+def _record_error(name, error):
+    print(f"Error refreshing {name}: {str(error)}")
+    with _lock:
+        if name in _frames:
+            df, meta = _frames[name]
+            _frames[name] = (df, {**meta, 'checked_at': time.time(), 'error': str(error)})
+        else:
+            _failed_at[name] = time.time()
+
+
+def refresh_sheets(names):
+    """
+    Fetch several sheets from Google Sheets in parallel, then publish them and
+    store them as snapshots. Append-only sheets only read their new rows.
+    Sheets that fail keep their last good copy and get the error recorded in
+    their metadata. Returns the fetch report.
+    """
+    names = list(names)
+    with _lock:
+        _refreshing.update(names)
+    try:
+        tails = {name: _tail_sync(name) for name in names}
+        frames, report = fetch_sheets({name: _read_options(name, tails[name]) for name in names})
+
+        results = {}
+        for name, raw in frames.items():
+            try:
+                results[name] = _sync(name, raw, tails[name])
+            except Exception as e:
+                report[name]['error'] = e
+
+        # Known rows were edited: fall back to a full reload
+        resync = [name for name, df in results.items() if df is None]
+        if resync:
+            frames, resync_report = fetch_sheets({name: SHEETS[name] for name in resync})
+            report.update(resync_report)
+            for name in resync:
+                tails[name] = None
+                del results[name]
+                if name in frames:
+                    try:
+                        results[name] = CLEANERS[name](frames[name])
+                    except Exception as e:
+                        report[name]['error'] = e
+
+        for name in names:
+            if name in results:
+                _publish(name, results[name], report[name]['seconds'], full_sync=tails[name] is None)
+            else:
+                _record_error(name, report[name]['error'])
+    finally:
+        with _lock:
+            _refreshing.difference_update(names)
+    return report
+
+
+def load_snapshots(names=SHEETS):
+    """Publish the stored copy of the sheets that are not in memory yet."""
+    for name in names:
+        with _lock:
+            if name in _frames:
+                continue
+        df, meta = load_snapshot(name)
+        if df is not None:
+            with _lock:
+                _frames.setdefault(name, (df, meta))
+
+
+def load_sheets(*names):
+    """
+    Return the cleaned frames of several sheets, in the order requested.
+    Data is served from memory (or from the local snapshot) and kept up to date
+    by the prefetcher, so pages never wait on Google Sheets unless there is no
+    copy at all yet; missing sheets are then fetched together. Frames are
+    shared between sessions and must not be modified in place.
+    """
+    load_snapshots(names)
+    with _lock:
+        missing = [name for name in names if name not in _frames]
+    for name in names:
+        if name not in missing:
+            _count(name, 'hits')
+
+    if missing:
+        # First run without a snapshot: nothing to serve, fetch synchronously
+        with st.spinner(translations['loading_data'][st.session_state.get('language', 'en')]):
+            report = refresh_sheets(missing)
+        failed = [name for name in missing if report[name]['error'] is not None]
+        if failed:
+            raise ConnectionError(f"Could not load sheets {failed} from Google Sheets")
+
+    with _lock:
+        return tuple(_frames[name][0] for name in names)
+
+
+def load_sheet(name):
+    """Return the cleaned frame of a single sheet (see load_sheets)."""
+    return load_sheets(name)[0]
+
+
+def frame_version(df):
+    """Content hash of a frame returned by load_sheets, None for any other frame."""
+    with _lock:
+        for frame, meta in _frames.values():
+            if frame is df:
+                return meta['hash']
+    return None
+
+
+def sheet_status(name):
+    """Metadata of the copy being served: fetch time, content hash, last error."""
+    with _lock:
+        entry = _frames.get(name)
+    meta = dict(entry[1]) if entry else {}
+    meta['refreshing'] = name in _refreshing
+    return meta
+
+
+def show_data_status(*names):
+    """Label the data shown on a page with its age, and warn when it is stale."""
+    statuses = [sheet_status(name) for name in names]
+    statuses = [s for s in statuses if 'fetched_at' in s]
+    if not statuses:
+        return
+    oldest = min(s['fetched_at'] for s in statuses)
+    as_of = datetime.fromtimestamp(oldest).strftime('%Y-%m-%d %H:%M')
+    language = st.session_state['language']
+    if any(s.get('error') for s in statuses):
+        st.warning(translations['data_stale'][language].format(as_of))
+    else:
+        refreshing = any(s['refreshing'] for s in statuses)
+        st.caption(translations['data_as_of'][language].format(as_of)
+                   + (" · " + translations['data_refreshing'][language] if refreshing else ""))
+
+
+def refresh_data():
+    """Reload every sheet in use from Google Sheets now."""
+    with _lock:
+        names = list(_frames)
+    refresh_sheets(names)
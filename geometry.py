@@ -0,0 +1,151 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# Installation layout around the water tank, in meters
+TANK_DIAMETER = 3.6
+MARGIN_DIAMETER = 13.6
+UMD_WIDTH = 1.4
+UMD_LENGTH = 9.0
+
+MODULES = ['101', '102', '103']
+
+# Rectangle corners of a module before rotation, closed for drawing
+CORNER_OFFSETS = np.array([
+    (-UMD_WIDTH/2, -UMD_LENGTH/2),
+    (UMD_WIDTH/2, -UMD_LENGTH/2),
+    (UMD_WIDTH/2, UMD_LENGTH/2),
+    (-UMD_WIDTH/2, UMD_LENGTH/2),
+    (-UMD_WIDTH/2, -UMD_LENGTH/2),
+])
+
+# Number of geometries kept in memory (one per dataset version)
+MAX_GEOMETRIES = 4
+
+_geometries = OrderedDict()
+_lock = threading.Lock()
+
+
+def parse_numbers(df, column):
+    """Comma-decimal values of a column for every module, as floats (NaN if unparsable)."""
+    values = [pd.to_numeric(df[f'{column}_m{m}'].astype(str).str.replace(',', '.', regex=False).str.strip(),
+                            errors='coerce') for m in MODULES]
+    return np.column_stack(values) if len(df) else np.empty((0, len(MODULES)))
+
+
+def installation_geometry(df):
+    """
+    Footprint of every module of every installation, as arrays with one row
+    per installation (in frame order, whatever the index) and one column per module:
+    ids, present (valid module id, the id_m*_valid columns of the cleaned
+    history), parsed (angles and distance are numbers),
+    rd/pa/ra (radio distance, position and rotation angle in degrees),
+    centers (..., 2) and closed rotated corners (..., 5, 2).
+    """
+    ids = df[[f'id_m{m}' for m in MODULES]].to_numpy(dtype=object)
+    rd = parse_numbers(df, 'RadioDistance')
+    pa = parse_numbers(df, 'PositionAngle')
+    ra = parse_numbers(df, 'RotationAngle')
+
+    pa_rad, ra_rad = np.radians(pa), np.radians(ra)
+    centers = np.stack([-rd * np.sin(pa_rad), -rd * np.cos(pa_rad)], axis=-1)
+
+    # Rotate the corner offsets by RA and move them to the module centre
+    dx, dy = CORNER_OFFSETS[:, 0], CORNER_OFFSETS[:, 1]
+    cos, sin = np.cos(ra_rad)[..., None], np.sin(ra_rad)[..., None]
+    corners = np.stack([-dx * cos - dy * sin, dx * sin - dy * cos], axis=-1) + centers[:, :, None, :]
+
+    return {
+        'ids': ids,
+        'present': df[[f'id_m{m}_valid' for m in MODULES]].to_numpy(dtype=bool),
+        'parsed': ~(np.isnan(rd) | np.isnan(pa) | np.isnan(ra)),
+        'rd': rd,
+        'pa': pa,
+        'ra': ra,
+        'centers': centers,
+        'corners': corners,
+    }
+
+
+def get_geometry(df, version):
+    """Return the geometry of the installation history, computed once per dataset version."""
+    with _lock:
+        if version in _geometries:
+            _geometries.move_to_end(version)
+            return _geometries[version]
+
+    geometry = installation_geometry(df)
+    if version is not None:
+        with _lock:
+            _geometries[version] = geometry
+            while len(_geometries) > MAX_GEOMETRIES:
+                _geometries.popitem(last=False)
+    return geometry
+
+
+def _module_axes(ra):
+    """Unit vectors along the width and length of every module footprint."""
+    cos, sin = np.cos(np.radians(ra)), np.sin(np.radians(ra))
+    return np.stack([-cos, sin], axis=-1), np.stack([-sin, -cos], axis=-1)
+
+
+def _overlaps(geometry, a, b):
+    """Separating axis test between modules a and b of every installation."""
+    corners_a = geometry['corners'][:, a, :4]
+    corners_b = geometry['corners'][:, b, :4]
+    axes = np.concatenate([np.stack(_module_axes(geometry['ra'][:, a]), axis=1),
+                           np.stack(_module_axes(geometry['ra'][:, b]), axis=1)], axis=1)
+
+    # Projections of the corners on every axis: (installations, axes, corners)
+    proj_a = np.einsum('nkd,ncd->nkc', axes, corners_a)
+    proj_b = np.einsum('nkd,ncd->nkc', axes, corners_b)
+    separated = (proj_a.max(axis=2) <= proj_b.min(axis=2) + 1e-9) | (proj_b.max(axis=2) <= proj_a.min(axis=2) + 1e-9)
+    return ~separated.any(axis=1)
+
+
+def _tank_distance(geometry):
+    """Distance from the tank centre to every module footprint (0 if inside)."""
+    width_axis, length_axis = _module_axes(geometry['ra'])
+    to_center = -geometry['centers']
+    local_x = np.abs((to_center * width_axis).sum(axis=-1)) - UMD_WIDTH / 2
+    local_y = np.abs((to_center * length_axis).sum(axis=-1)) - UMD_LENGTH / 2
+    return np.hypot(np.maximum(local_x, 0), np.maximum(local_y, 0))
+
+
+def validate_installations(df, geometry):
+    """
+    Check the footprint of every installed module at once: modules whose
+    distance or angles cannot be parsed, modules overlapping another module of
+    the same installation, intruding on the tank or reaching past the margin.
+    Returns one row per module with at least one problem.
+    """
+    present, parsed = geometry['present'], geometry['parsed']
+    usable = present & parsed
+
+    with np.errstate(invalid='ignore'):
+        tank = usable & (_tank_distance(geometry) < TANK_DIAMETER / 2)
+        outside = usable & (np.linalg.norm(geometry['corners'], axis=-1).max(axis=-1) > MARGIN_DIAMETER / 2)
+
+        overlap_with = np.empty(present.shape, dtype=object)
+        overlap_with[:] = ''
+        for a, b in [(0, 1), (0, 2), (1, 2)]:
+            hit = usable[:, a] & usable[:, b] & _overlaps(geometry, a, b)
+            overlap_with[hit, a] += f"m-{MODULES[b]} "
+            overlap_with[hit, b] += f"m-{MODULES[a]} "
+
+    unparsable = present & ~parsed
+    flagged = unparsable | tank | outside | (overlap_with != '')
+    rows, modules = np.nonzero(flagged)
+
+    return pd.DataFrame({
+        'position': df['position'].to_numpy()[rows],
+        'install_date': df['install_date'].to_numpy()[rows],
+        'module': [f"m-{MODULES[m]}" for m in modules],
+        'umd': geometry['ids'][rows, modules],
+        'overlap': [text.strip() for text in overlap_with[rows, modules]],
+        'tank': tank[rows, modules],
+        'outside_margin': outside[rows, modules],
+        'unparsable': unparsable[rows, modules],
+        'max_distance': np.round(np.linalg.norm(geometry['corners'][rows, modules], axis=-1).max(axis=-1), 2),
+    })
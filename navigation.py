@@ -4,6 +4,8 @@ from streamlit.runtime.scriptrunner import get_script_run_ctx
 from streamlit.source_util import get_pages
 from translations import lang_content as translations
 from utils import switch_language
+from data_loader import refresh_data
+from prefetcher import start_prefetcher
 
 
 def get_current_page_name() -> str:
@@ -15,6 +17,9 @@ def get_current_page_name() -> str:
 
 
 def make_sidebar():
+    # Keep the Google Sheets data warm in the background for every page
+    start_prefetcher()
+
     with st.sidebar:
         if st.session_state.get("logged_in", False):
             st.title("Navigation")
@@ -24,6 +29,7 @@ def make_sidebar():
             st.page_link("pages/3_📊_Acquisitions.py", label="Acquisition", icon="📊")
             st.page_link("pages/4_📈_Statistics.py", label="Statistics", icon="📈")
             st.page_link("pages/5_🔍_UMD_Details.py", label="UMD Details", icon="🔍")   
+            st.page_link("pages/6_📐_Validation.py", label="Validation", icon="📐")
 
             st.write("")
             st.write("")
@@ -32,6 +38,10 @@ def make_sidebar():
             if st.button("🌐 " + translations['switch_language'][st.session_state['language']]):
                 switch_language()
 
+            # Fetch every loaded sheet from Google Sheets again right away
+            st.button("🔄 " + translations['refresh_data'][st.session_state['language']],
+                      on_click=refresh_now)
+
             if st.button("Log out"):
                 logout()
 
@@ -59,6 +69,12 @@ def make_sidebar():
         )
         
         
+def refresh_now():
+    # The refresh runs synchronously (with retries), show that it is working
+    with st.spinner(translations['loading_data'][st.session_state['language']]):
+        refresh_data()
+
+
 def logout():
     st.session_state.logged_in = False
     st.info("Logged out successfully!")
@@ -1,46 +1,49 @@
 import streamlit as st
 from navigation import make_sidebar
 import pandas as pd
-from streamlit_gsheets import GSheetsConnection
 from translations import lang_content as translations
 import numpy as np
 from datetime import datetime
-from utils import search_dataframe, get_image_content, clean_url, photo_formatter
+from utils import get_report_photo, clean_url, photo_formatter, keep_selection
+from photo_cache import fetch_photos, get_thumbnail, prefetch_photos, PREFETCH_REPORTS
+from query_filter import (run_search, cached_filter, equals_mask, date_mask, cross_facet_counts,
+                          facet_label, FIELD_WORK_FIELDS)
 import re
-import time
-import io
 from utils import check_login
+from data_loader import load_sheet, show_data_status, frame_version
+
+# Rows per page offered for the results table
+PAGE_SIZES = [25, 50, 100]
+
+# Photos per gallery page and per gallery row
+GALLERY_PAGE_SIZE = 24
+GALLERY_COLUMNS = 6
+
+PHOTO_LINK_RE = re.compile(r'(https://drive\.google\.com/open\?id=[^\s,]+)')
+
 
 # Check if user is logged in, redirect to home page if not
 if not check_login():
     st.stop()
 make_sidebar()
 
-st.header(translations['tab_field_title'][st.session_state['language']], divider="grey")
-
-conn = st.connection("nico", type=GSheetsConnection)
-
-# Specify the column indices you want to select
-column_indices = [1, 2, 3, 5, 6, 54]
 
-# Rename the columns
-new_column_names = ['content', 'position(id)', 'type', 'team', 'date', 'photos']
+# The dialog title reads the session language, only set once logged in
+@st.dialog(translations['photos_header'][st.session_state['language']], width="large")
+def show_full_photo(link):
+    with st.spinner(translations['loading_image'][st.session_state['language']]):
+        try:
+            st.image(get_report_photo(link), use_column_width=True)
+        except Exception as e:
+            st.error(f"{translations['image_load_error'][st.session_state['language']]} {str(e)}")
+    st.markdown(f"[{translations['image_link'][st.session_state['language']]}]({link})")
 
-df = conn.read(usecols=column_indices, names=new_column_names,
-                parse_dates=['date'],
-                dayfirst=True,
-                header=0)
 
-# Extract name and id from position(id) column
-df[['name', 'id']] = df['position(id)'].str.extract(r'([\w\s.]+)\s*\(id=(\d+)\)', expand=True)
-
-# Format the date column (keep original date column for sorting)
-# Ensure date column is in datetime format
-df['date'] = pd.to_datetime(df['date'], errors='coerce', dayfirst=True)
-df['formatted_date'] = df['date'].dt.strftime('%Y-%m-%d')
+st.header(translations['tab_field_title'][st.session_state['language']], divider="grey")
 
-# Drop the position(id) column
-df = df.drop(columns=['position(id)'])
+df = load_sheet("nico")
+version = frame_version(df)
+show_data_status("nico")
 
 # Get min and max dates
 if len(df) > 0:
@@ -61,47 +64,54 @@ with colA:
     search_query = st.text_input(
         label=translations['search_placeholder'][st.session_state['language']],
         key="search_tab_field",
-        label_visibility="collapsed"
+        label_visibility="collapsed",
+        help=translations['search_help'][st.session_state['language']].format(', '.join(FIELD_WORK_FIELDS))
     )
+    fuzzy_search = st.toggle(translations['fuzzy_search'][st.session_state['language']], key="fuzzy_tab_field")
 
-    # Reset index before applying search to ensure proper alignment
-    df = df.reset_index(drop=True)
-    
-    if search_query:
-        search_mask = search_dataframe(df, search_query)
-        df_filtered = df[search_mask].copy()  # Create a copy to avoid SettingWithCopyWarning
-        if len(df_filtered) == 0:
-            st.warning(translations['no_results'][st.session_state['language']].format(search_query))
-        else:
-            st.info(translations['search_results'][st.session_state['language']].format(len(df_filtered), search_query))
-            df = df_filtered  # Only update df if there are matches
+    # Each filter step is memoized, see query_filter.cached_filter
+    search_key = ('field_work', search_query, fuzzy_search)
+
+    def search_step():
+        return run_search(df, search_query, FIELD_WORK_FIELDS, 'date', fuzzy=fuzzy_search)
+
+    search = cached_filter(version, search_key, search_step)
+    if search['invalid']:
+        st.warning(translations['query_invalid'][st.session_state['language']].format(', '.join(search['invalid'])))
+    if search['matches'] == 0:
+        st.warning(translations['no_results'][st.session_state['language']].format(search_query))
+    elif search['matches']:
+        st.info(translations['search_results'][st.session_state['language']].format(search['matches'], search_query))
+
+    # Dropdown counts under the other filters, see query_filter.cross_facet_counts
+    selected = {'name': st.session_state.get('name_dropdown_1'), 'type': st.session_state.get('type_dropdown_1')}
+    facet_dates = (st.session_state.get('start_date_1', min_date), st.session_state.get('end_date_1', max_date))
+
+    def facet_step():
+        return cross_facet_counts(df, search['mask'] & date_mask(df['date'], *facet_dates), selected)
+
+    counts = cached_filter(version, search_key + ('facets',) + tuple(selected.values()) + facet_dates, facet_step)
 
     col1, col2 = st.columns(2)
 
     with col1:
         st.markdown(f"### {translations['position_label'][st.session_state['language']]}")
+        keep_selection("name_dropdown_1")
         name_dropdown = st.selectbox(translations['position_label'][st.session_state['language']],
-                                        np.sort(df['name'].unique()), index=None,
+                                        counts['name'].index, index=None,
+                                        format_func=facet_label(counts['name']),
                                         placeholder=translations['position_placeholder'][st.session_state['language']],
                                         key="name_dropdown_1", label_visibility="collapsed")
 
-    if name_dropdown is None:
-        filtered_by_name = df
-    else:
-        filtered_by_name = df[(df['name'] == name_dropdown)]
-
     with col2:
         st.markdown(f"### {translations['type_label'][st.session_state['language']]}")
+        keep_selection("type_dropdown_1")
         type_dropdown = st.selectbox(translations['type_label'][st.session_state['language']],
-                                        filtered_by_name['type'].unique(), index=None,
+                                        counts['type'].index, index=None,
+                                        format_func=facet_label(counts['type']),
                                         placeholder=translations['type_placeholder'][st.session_state['language']],
                                         key="type_dropdown_1", label_visibility="collapsed")
 
-    if type_dropdown is None:
-        filtered_by_type = filtered_by_name
-    else:
-        filtered_by_type = filtered_by_name[(filtered_by_name['type'] == type_dropdown)]
-
     st.markdown(f"### {translations['date_interval_label'][st.session_state['language']]}")
 
     col3, col4 = st.columns(2)
@@ -113,13 +123,20 @@ with colA:
         end_date = st.date_input(translations['to_label'][st.session_state['language']],
                                     value=max_date, key="end_date_1")
 
-    if start_date is None and end_date is None:
-        filtered_by_date = filtered_by_type
+    def final_step():
+        mask = search['mask'] & equals_mask(df['name'], name_dropdown) & equals_mask(df['type'], type_dropdown)
+        if start_date is not None or end_date is not None:
+            mask &= date_mask(df['date'], start_date, end_date)
 
-    if start_date is not None and end_date is not None:
-        filtered_by_date = filtered_by_type[(filtered_by_type['formatted_date'] >= start_date.strftime('%Y-%m-%d')) & (filtered_by_type['formatted_date'] <= end_date.strftime('%Y-%m-%d'))]
+        # Only the light columns: the report body and photos are read for the selected row
+        table = df.loc[mask, ['date', 'name', 'id', 'type']].sort_values(by='date', ascending=False)
+        if search['scores'] is not None:
+            # Show the best fuzzy matches first
+            table = table.iloc[np.argsort(-search['scores'][table.index].values, kind='stable')]
+        return table
 
-    final_table = filtered_by_date[['formatted_date', 'name', 'id', 'type', 'content', 'photos']].sort_values(by='formatted_date', ascending=False)
+    filter_key = search_key + (name_dropdown, type_dropdown, start_date, end_date)
+    final_table = cached_filter(version, filter_key, final_step)
     selections = ["name_dropdown", "type_dropdown"]
 
     def clear_all():
@@ -133,62 +150,147 @@ with colA:
     st.header(translations['results_header'][st.session_state['language']], divider="grey")
     st.caption(translations['click_report'][st.session_state['language']])
 
-    
-
-    # Create a new column for the photo indicator
-    final_table['photo_indicator'] = final_table['photos'].apply(photo_formatter)
 
-    selection = st.dataframe(final_table, on_select="rerun", selection_mode="single-row",
-                                height=200 if len(df) > 5 else None, width=800, column_config={
-                                    "content": None,
-                                    "photos": None,  # Hide the original photos column
-                                    "photo_indicator": st.column_config.Column(
-                                        "Fotos",
-                                        width="small",
-                                        help="📷 indicates available photos"
-                                    ),
-                                    "formatted_date": "Fecha",
-                                    "type": "Tipo de Salida",
-                                    "name": "Posición"
-                                }, hide_index=True)
+    # Go back to the first page when the filters change
+    if st.session_state.get('results_filters_1') != filter_key:
+        st.session_state['results_filters_1'] = filter_key
+        st.session_state['results_page_1'] = 1
+        st.session_state['gallery_page_1'] = 1
+
+    table_container = st.container()
+    col_page, col_size = st.columns(2)
+    with col_size:
+        page_size = st.selectbox(translations['page_size'][st.session_state['language']], PAGE_SIZES,
+                                 key='results_page_size_1')
+    page_count = max(1, -(-len(final_table) // page_size))
+    if st.session_state.get('results_page_1', 1) > page_count:
+        st.session_state['results_page_1'] = page_count
+    with col_page:
+        page = st.number_input(translations['page_number'][st.session_state['language']].format(page_count),
+                               min_value=1, max_value=page_count, step=1, key='results_page_1')
+
+    prefetch = st.toggle(translations['prefetch_photos'][st.session_state['language']], key='prefetch_photos_1')
+    gallery = st.toggle(translations['gallery_view'][st.session_state['language']], key='gallery_view_1')
+
+    # Preload the photos of the first reports with photos, restarting when the filters change
+    prefetch_key = filter_key if prefetch else None
+    if st.session_state.get('prefetch_key_1') != prefetch_key:
+        st.session_state['prefetch_key_1'] = prefetch_key
+        if st.session_state.get('prefetch_cancel_1') is not None:
+            st.session_state['prefetch_cancel_1'].set()
+        st.session_state['prefetch_cancel_1'] = None
+        if prefetch:
+            reports = df['photos'].reindex(final_table.index).dropna().astype(str)
+            reports = reports[reports.str.contains('drive.google.com', regex=False)]
+            links = [clean_url(link) for photos in reports.head(PREFETCH_REPORTS)
+                     for link in PHOTO_LINK_RE.findall(photos)]
+            st.session_state['prefetch_cancel_1'] = prefetch_photos(links)
+
+    # Only the rows of the current page are sent to the browser
+    first = (page - 1) * page_size
+    page_table = final_table.iloc[first:first + page_size].copy()
+    page_table['photo_indicator'] = df.loc[page_table.index, 'photos'].apply(photo_formatter)
+
+    with table_container:
+        selection = st.dataframe(page_table, on_select="rerun", selection_mode="single-row",
+                                    height=200 if len(page_table) > 5 else None, width=800, column_config={
+                                        "photo_indicator": st.column_config.Column(
+                                            "Fotos",
+                                            width="small",
+                                            help="📷 indicates available photos"
+                                        ),
+                                        "date": st.column_config.DateColumn("Fecha", format="YYYY-MM-DD"),
+                                        "type": "Tipo de Salida",
+                                        "name": "Posición"
+                                    }, hide_index=True)
+        if len(final_table) > 0:
+            st.caption(translations['showing_rows'][st.session_state['language']].format(
+                first + 1, first + len(page_table), len(final_table)))
 
 
 
     with colB:
         st.header(translations['report_header'][st.session_state['language']], divider="grey")
         if len(selection["selection"]["rows"]) > 0:
-            selected_row = final_table.iloc[selection["selection"]["rows"]]
-            md_content = selected_row["content"].values[0]
+            # Fetch the report body of the selected row on demand
+            report = df.loc[page_table.index[selection["selection"]["rows"][0]]]
+            md_content = report["content"]
             with st.container():
                 st.write(md_content)
 
             # Add photo visualization
-            photos = selected_row["photos"].values[0]
+            photos = report["photos"]
             if photos and isinstance(photos, str):
-                photo_links = re.findall(r'(https://drive\.google\.com/open\?id=[^\s,]+)', photos)
+                photo_links = PHOTO_LINK_RE.findall(photos)
                 photo_links = [clean_url(link) for link in photo_links]
 
                 if photo_links:
                     st.subheader(translations['photos_header'][st.session_state['language']])
 
-                    for link in photo_links:
-                        with st.spinner(translations['loading_image'][st.session_state['language']]):
-                            try:
-                                img = get_image_content(link)
+                    # Download all photos at once and show each one as soon as it arrives
+                    slots = [st.empty() for _ in photo_links]
+                    for slot in slots:
+                        slot.caption(translations['loading_image'][st.session_state['language']])
+                    for i, photo, error in fetch_photos(photo_links, load=get_thumbnail):
+                        with slots[i].container():
+                            if error is None:
+                                # Thumbnails in the panel, full resolution only on request
+                                st.image(photo, use_column_width=True)
+                                if st.button(translations['enlarge_photo'][st.session_state['language']],
+                                             key=f"enlarge_{i}_{photo_links[i]}"):
+                                    show_full_photo(photo_links[i])
+                            else:
+                                st.error(f"{translations['image_load_error'][st.session_state['language']]} {str(error)}")
+                                st.markdown(f"[{translations['image_link'][st.session_state['language']]}]({photo_links[i]})")
+                else:
+                    st.info(translations['no_photos'][st.session_state['language']])
 
-                                if img.mode == 'RGBA':
-                                    img = img.convert('RGB')
 
-                                img_byte_arr = io.BytesIO()
-                                img.save(img_byte_arr, format='JPEG')
-                                img_byte_arr = img_byte_arr.getvalue()
+def gallery_step():
+    # Every photo of the filtered reports, newest first, each one once
+    reports = df.loc[final_table.index, ['date', 'name', 'photos']].dropna(subset=['photos'])
+    rows = [(date, name, clean_url(link)) for date, name, photos in reports.itertuples(index=False)
+            for link in PHOTO_LINK_RE.findall(str(photos))]
+    photos = pd.DataFrame(rows, columns=['date', 'name', 'link'])
+    return photos.sort_values('date', ascending=False, kind='stable').drop_duplicates('link').reset_index(drop=True)
 
-                                st.image(img_byte_arr, use_column_width=True)
 
-                            except Exception as e:
-                                st.error(f"{translations['image_load_error'][st.session_state['language']]} {str(e)}")
-                                st.markdown(f"[{translations['image_link'][st.session_state['language']]}]({link})")
+if gallery:
+    st.header(translations['gallery_header'][st.session_state['language']], divider="grey")
+    gallery_photos = cached_filter(version, filter_key + ('gallery',), gallery_step)
 
-                            time.sleep(0.1)
+    if len(gallery_photos) == 0:
+        st.info(translations['no_photos'][st.session_state['language']])
+    else:
+        gallery_pages = -(-len(gallery_photos) // GALLERY_PAGE_SIZE)
+        if st.session_state.get('gallery_page_1', 1) > gallery_pages:
+            st.session_state['gallery_page_1'] = gallery_pages
+        col_page, col_count = st.columns(2)
+        with col_page:
+            gallery_page = st.number_input(translations['page_number'][st.session_state['language']].format(gallery_pages),
+                                           min_value=1, max_value=gallery_pages, step=1, key='gallery_page_1')
+        with col_count:
+            st.caption(translations['gallery_count'][st.session_state['language']].format(len(gallery_photos)))
+
+        # Only the thumbnails of the visible page are fetched, grouped by day
+        first = (gallery_page - 1) * GALLERY_PAGE_SIZE
+        visible = gallery_photos.iloc[first:first + GALLERY_PAGE_SIZE]
+        slots = []
+        for day, group in visible.groupby(visible['date'].dt.date, sort=False, dropna=False):
+            st.subheader(str(day) if pd.notna(day) else "—")
+            for start in range(0, len(group), GALLERY_COLUMNS):
+                row_size = min(GALLERY_COLUMNS, len(group) - start)
+                slots += [col.empty() for col in st.columns(GALLERY_COLUMNS)[:row_size]]
+        for slot in slots:
+            slot.caption(translations['loading_image'][st.session_state['language']])
+
+        for i, photo, error in fetch_photos(visible['link'], load=get_thumbnail):
+            link = visible['link'].iloc[i]
+            with slots[i].container():
+                if error is None:
+                    st.image(photo, caption=str(visible['name'].iloc[i]), use_column_width=True)
+                    if st.button(translations['enlarge_photo'][st.session_state['language']], key=f"gallery_{link}"):
+                        show_full_photo(link)
                 else:
-                    st.info(translations['no_photos'][st.session_state['language']])
+                    st.error(f"{translations['image_load_error'][st.session_state['language']]} {str(error)}")
+                    st.markdown(f"[{translations['image_link'][st.session_state['language']]}]({link})")
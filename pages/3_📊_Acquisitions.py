@@ -1,12 +1,13 @@
 import streamlit as st
 import pandas as pd
-from streamlit_gsheets import GSheetsConnection
 from translations import lang_content as translations
 from navigation import make_sidebar
 from datetime import datetime
 import numpy as np
-from utils import search_dataframe
-from utils import check_login
+from query_filter import (run_search, cached_filter, equals_mask, date_mask, cross_facet_counts,
+                          facet_label, ACQUISITION_FIELDS)
+from utils import check_login, keep_selection
+from data_loader import load_sheet, show_data_status, frame_version
 
 # Check if user is logged in, redirect to home page if not
 if not check_login():
@@ -15,29 +16,14 @@ make_sidebar()
 
 st.header(translations['tab_acq_title'][st.session_state['language']], divider="grey")
 
-# Connect to Google Sheets
-conn = st.connection("belu", type=GSheetsConnection)
-
-# Specify the column indices you want to select
-column_indices = [0, 2, 3, 6, 9, 11, 12]
-
-# Rename the columns
-new_column_names = ['position', 'modules', 'date_report',
-                    'summary', 'team', 'status', 'report']
-
-df = conn.read(usecols=column_indices, names=new_column_names,
-                parse_dates=['date_report'],
-                dayfirst=True,
-                header=0)
-
-# Format the date column
-df['date_report'] = df['date_report'].dt.strftime('%Y-%m-%d')
-df['date'] = df['date_report']
+df = load_sheet("belu")
+version = frame_version(df)
+show_data_status("belu")
 
 # Get min and max dates before any filtering
 if len(df) > 0:
-    min_date = datetime.strptime(df['date_report'].min(), '%Y-%m-%d')
-    max_date = datetime.strptime(df['date_report'].max(), '%Y-%m-%d')
+    min_date = df['date'].min()
+    max_date = df['date'].max()
 else:
     min_date = datetime.now()
     max_date = datetime.now()
@@ -53,60 +39,64 @@ with colA:
     search_query = st.text_input(
         label=translations['search_placeholder'][st.session_state['language']],
         key="search_tab_acq",
-        label_visibility="collapsed"
+        label_visibility="collapsed",
+        help=translations['search_help'][st.session_state['language']].format(', '.join(ACQUISITION_FIELDS))
     )
+    fuzzy_search = st.toggle(translations['fuzzy_search'][st.session_state['language']], key="fuzzy_tab_acq")
 
-    # Reset index before applying search to ensure proper alignment
-    df = df.reset_index(drop=True)
-    
-    if search_query:
-        search_mask = search_dataframe(df, search_query)
-        df_filtered = df[search_mask].copy()  # Create a copy to avoid SettingWithCopyWarning
-        if len(df_filtered) == 0:
-            st.warning(translations['no_results'][st.session_state['language']].format(search_query))
-        else:
-            st.info(translations['search_results'][st.session_state['language']].format(len(df_filtered), search_query))
-            df = df_filtered  # Only update df if there are matches
+    # Each filter step is memoized, see query_filter.cached_filter
+    search_key = ('acquisitions', search_query, fuzzy_search)
+
+    def search_step():
+        return run_search(df, search_query, ACQUISITION_FIELDS, 'date', fuzzy=fuzzy_search)
+
+    search = cached_filter(version, search_key, search_step)
+    if search['invalid']:
+        st.warning(translations['query_invalid'][st.session_state['language']].format(', '.join(search['invalid'])))
+    if search['matches'] == 0:
+        st.warning(translations['no_results'][st.session_state['language']].format(search_query))
+    elif search['matches']:
+        st.info(translations['search_results'][st.session_state['language']].format(search['matches'], search_query))
+
+    # Dropdown counts under the other filters, see query_filter.cross_facet_counts
+    selected = {'position': st.session_state.get('name_dropdown_2'), 'status': st.session_state.get('type_dropdown_2'),
+                'team': st.session_state.get('team_dropdown_2')}
+    facet_dates = (st.session_state.get('start_date_2', min_date), st.session_state.get('end_date_2', max_date))
+
+    def facet_step():
+        return cross_facet_counts(df, search['mask'] & date_mask(df['date'], *facet_dates), selected)
+
+    counts = cached_filter(version, search_key + ('facets',) + tuple(selected.values()) + facet_dates, facet_step)
 
     col1, col2, col3 = st.columns(3)
 
     with col1:
         st.markdown(f"### {translations['position_label'][st.session_state['language']]}")
+        keep_selection("name_dropdown_2")
         name_dropdown = st.selectbox(translations['position_label'][st.session_state['language']],
-                                        np.sort(df['position'].unique()), index=None,
+                                        counts['position'].index, index=None,
+                                        format_func=facet_label(counts['position']),
                                         placeholder=translations['position_placeholder'][st.session_state['language']],
                                         key="name_dropdown_2", label_visibility="collapsed")
 
-    if name_dropdown is None:
-        filtered_by_name = df
-    else:
-        filtered_by_name = df[(df['position'] == name_dropdown)]
-
-        
     with col2:
         st.markdown(f"### {translations['status_label'][st.session_state['language']]}")
+        keep_selection("type_dropdown_2")
         type_dropdown = st.selectbox(translations['status_label'][st.session_state['language']],
-                                        filtered_by_name['status'].unique(), index=None,
+                                        counts['status'].index, index=None,
+                                        format_func=facet_label(counts['status']),
                                         placeholder=translations['status_placeholder'][st.session_state['language']],
                                         key="type_dropdown_2", label_visibility="collapsed")
 
     with col3:
         st.markdown(f"### {translations['team_label'][st.session_state['language']]}")
+        keep_selection("team_dropdown_2")
         team_dropdown = st.selectbox(translations['team_label'][st.session_state['language']],
-                                        np.sort(filtered_by_name['team'].unique()), index=None,
+                                        counts['team'].index, index=None,
+                                        format_func=facet_label(counts['team']),
                                         placeholder=translations['team_placeholder'][st.session_state['language']],
                                         key="team_dropdown_2", label_visibility="collapsed")
 
-    if type_dropdown is None:
-        filtered_by_type = filtered_by_name
-    else:
-        filtered_by_type = filtered_by_name[(filtered_by_name['status'] == type_dropdown)]
-
-    if team_dropdown is None:
-        filtered_by_team = filtered_by_type
-    else:
-        filtered_by_team = filtered_by_type[(filtered_by_type['team'] == team_dropdown)]
-
     st.markdown(f"### {translations['date_interval_label'][st.session_state['language']]}")
 
     col4, col5 = st.columns(2)
@@ -118,14 +108,21 @@ with colA:
         end_date = st.date_input(translations['to_label'][st.session_state['language']],
                                     value=max_date, key="end_date_2")
 
-    if start_date is None and end_date is None:
-        filtered_by_date = filtered_by_team
-
-    if start_date is not None and end_date is not None:
-        filtered_by_date = filtered_by_team[(filtered_by_team['date'] >= start_date.strftime('%Y-%m-%d')) & (filtered_by_team['date'] <= end_date.strftime('%Y-%m-%d'))]
-
-    final_table = filtered_by_date[['date','position', 'modules', 'summary', 'status', 'team', 'report']].sort_values('status',ascending=True)
-    final_table_colA = final_table.loc[final_table['status']!='Complete']
+    def final_step():
+        mask = (search['mask'] & equals_mask(df['position'], name_dropdown)
+                & equals_mask(df['status'], type_dropdown) & equals_mask(df['team'], team_dropdown))
+        if start_date is not None or end_date is not None:
+            mask &= date_mask(df['date'], start_date, end_date)
+
+        table = df.loc[mask, ['date','position', 'modules', 'summary', 'status', 'team', 'report']].sort_values('status',ascending=True)
+        if search['scores'] is not None:
+            # Show the best fuzzy matches first
+            table = table.iloc[np.argsort(-search['scores'][table.index].values, kind='stable')]
+        return table, table.loc[table['status']!='Complete']
+
+    final_table, final_table_colA = cached_filter(version, search_key + (name_dropdown, type_dropdown, team_dropdown,
+                                                                       start_date, end_date),
+                                                  final_step)
     
     selections = ["name_dropdown", "type_dropdown", "team_dropdown"]
     def clear_all():
@@ -144,7 +141,7 @@ with colA:
                                 height=200 if len(final_table_colA) > 5 else None, width=800, 
                                 column_config={
                                     "report": None,
-                                    "date": "Date",
+                                    "date": st.column_config.DateColumn("Date", format="YYYY-MM-DD"),
                                     "modules": "Modules",
                                     "position": "Position",
                                     "summary": "Summary of issue",
@@ -167,7 +164,7 @@ with colA:
                                     width=800, 
                                     column_config={
                                         "report": None,
-                                        "date": "Date",
+                                        "date": st.column_config.DateColumn("Date", format="YYYY-MM-DD"),
                                         "modules": "Modules",
                                         "position": "Position",
                                         "summary": "Summary of issue",
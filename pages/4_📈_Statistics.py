@@ -1,10 +1,13 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+import plotly.graph_objects as go
 from translations import lang_content as translations
-from streamlit_gsheets import GSheetsConnection
 from navigation import make_sidebar
 from utils import check_login, SHADED_PERIODS
+from data_loader import load_sheets, show_data_status, frame_version
+from query_filter import cached_filter
+from timeline import (step_points, cumulative_timeline, downsample, quarter_ranges,
+                      period_metrics)
 
 # Check if user is logged in, redirect to home page if not
 if not check_login():
@@ -13,71 +16,16 @@ make_sidebar()
 
 st.header(translations['tab_stats_title'][st.session_state['language']], divider="grey")
 
-# Stock dataframe - Assembly progress
-conn_stock = st.connection("stats_stock", type=GSheetsConnection)
-df_stock = conn_stock.read(
-    usecols=[0, 1],
-    names=['date', 'UMD_number'],
-    header=None,
-    dayfirst=True,
-    skiprows=9
-).dropna()  # Remove rows without cumulative numbers
-
-# Convert and clean stock data
-df_stock['UMD_number'] = df_stock['UMD_number'].astype(int)
-df_stock['date'] = pd.to_datetime(df_stock['date'], format="%d/%m/%y")
-
-# Installation history dataframe
-conn_historial = st.connection("stats_historial", type=GSheetsConnection)
-df_historial = conn_historial.read(
-    usecols=[2, 3, 6, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 31, 32, 33],  # name, id, install_date, id_m101, id_m102, id_m103, RotationAngle_m101, RadioDistance_m101, PositionAngle_m101, RotationAngle_m102, RadioDistance_m102, PositionAngle_m102, RotationAngle_m103, RadioDistance_m103, PositionAngle_m103
-    names=['position', 'id', 'install_date', 
-    'id_m101', 'RotationAngle_m101', 'RadioDistance_m101', 'PositionAngle_m101',
-    'id_m102', 'RotationAngle_m102', 'RadioDistance_m102', 'PositionAngle_m102',
-    'id_m103', 'RotationAngle_m103', 'RadioDistance_m103', 'PositionAngle_m103',
-    'ekit_m101', 'ekit_m102', 'ekit_m103'],
-    header=None,
-    skiprows=7
-)
-
-# Clean installation data
-df_historial = df_historial[~df_historial["install_date"].str.contains("-", na=False)]  # Remove not installed
-df_historial['install_date'] = pd.to_datetime(df_historial['install_date'], dayfirst=True, errors='coerce')  # Convert install_date to datetime
-df_historial = df_historial.dropna(subset=['install_date'])  # Remove rows without install date
-df_historial['id'] = df_historial['id'].astype(int)
-
-# Count only valid modules (starting with "M-")
-def is_valid_module(x):
-    return isinstance(x, str) and x.startswith('M-')
-
-# Apply the validation to each module column
-module_columns = ['id_m101', 'id_m102', 'id_m103']
-for col in module_columns:
-    df_historial[f'{col}_valid'] = df_historial[col].apply(is_valid_module)
-
-# Count valid modules per installation
-df_historial['modules_installed'] = df_historial[[f'{col}_valid' for col in module_columns]].sum(axis=1)
-df_historial = df_historial.sort_values(by='install_date')
+# Stock dataframe (assembly progress) and installation history, fetched together
+df_stock, df_historial = load_sheets("stats_stock", "stats_historial")
+show_data_status("stats_stock", "stats_historial")
 
 # Display metrics
 st.markdown(f"## {translations['stats_header'][st.session_state['language']]}")
 
-# Time period filter
-def generate_quarters(start_date, end_date):
-    quarters = {}
-    current = pd.Timestamp(start_date)
-    while current <= end_date:
-        quarter = (current.month - 1) // 3 + 1
-        quarter_start = pd.Timestamp(f"{current.year}-{(quarter-1)*3 + 1:02d}-01")
-        quarter_end = quarter_start + pd.offsets.QuarterEnd()
-        quarters[f"Q{quarter} {current.year}"] = (quarter_start, quarter_end)
-        current = quarter_start + pd.DateOffset(months=3)
-    return quarters
-
-# Generate quarters from Jan 2023 to current date
-start_date = pd.Timestamp('2023-01-01')
-end_date = pd.Timestamp.now()
-quarter_filters = generate_quarters(start_date, end_date)
+# Quarters from Jan 2023 to the current date
+today = pd.Timestamp.now().normalize()
+quarter_filters = quarter_ranges('2023-01-01', today)
 
 # Combine all filters into one dictionary
 # Añade la opción "Custom" al diccionario de filtros
@@ -90,16 +38,22 @@ all_time_filters = {
     **quarter_filters
 }
 
-# Sort quarter keys chronologically descending based on their start date
-sorted_quarter_keys = sorted(
-    quarter_filters.keys(), 
-    key=lambda k: quarter_filters[k][0], 
-    reverse=True
-)
+# Quarter keys from the most recent one
+sorted_quarter_keys = list(reversed(quarter_filters))
 
 # Define the final order for the selectbox
 ordered_filter_keys = sorted_quarter_keys + ['Last Year', 'Last Quarter', 'Last Month', 'Custom', 'All Time']
 
+# Metrics of every quarter and relative period, computed together once per
+# data version and day, so switching periods is a lookup
+periods = {name: (start, end, False) for name, (start, end) in quarter_filters.items()}
+periods.update({name: (today - offset, None, True) for name, offset in all_time_filters.items()
+                if isinstance(offset, pd.DateOffset)})
+versions = (frame_version(df_stock), frame_version(df_historial))
+period_table = cached_filter(None if None in versions else versions, ('period_metrics', today),
+                             lambda: period_metrics(df_stock, df_historial, periods))
+
+
 def format_time_filter(x):
     key = f'stats_filter_{x.lower().replace(" ", "_")}'
     try:
@@ -133,45 +87,25 @@ with filter_col:
 filter_value = all_time_filters[selected_filter]
 
 if filter_value is not None:
-    if filter_value == 'custom' and custom_start and custom_end:
-        # Para custom, usa las fechas seleccionadas
+    if filter_value == 'custom':
+        # Custom ranges are computed on demand with the same engine
         start_date = pd.Timestamp(custom_start)
         end_date = pd.Timestamp(custom_end)
-        df_stock_filtered = df_stock[(df_stock['date'] >= start_date) & (df_stock['date'] <= end_date)]
-        df_historial_filtered = df_historial[(df_historial['install_date'] >= start_date) & (df_historial['install_date'] <= end_date)]
-
-        assembled_delta = int(df_stock_filtered['UMD_number'].max() - df_stock[df_stock['date'] < start_date]['UMD_number'].max()) if not df_stock_filtered.empty and not df_stock[df_stock['date'] < start_date].empty else int(df_stock_filtered['UMD_number'].max()) if not df_stock_filtered.empty else 0
-        installed_delta = int(df_historial_filtered['modules_installed'].sum())
-        positions_delta = df_historial_filtered['position'].nunique()
-    elif isinstance(filter_value, pd.DateOffset):
-        # For relative periods (Last Month, Last Quarter, Last Year)
-        cutoff_date = pd.Timestamp.now() - filter_value
-        # Filter dataframes based on cutoff_date
-        df_stock_filtered = df_stock[df_stock['date'] > cutoff_date]
-        df_historial_filtered = df_historial[df_historial['install_date'] > cutoff_date]
-        
-        # Calculate deltas based on the full dataset up to the cutoff
-        previous_max_stock = df_stock[df_stock['date'] <= cutoff_date]['UMD_number'].max()
-        current_max_stock = df_stock['UMD_number'].max() # Use overall max for current assembly
-        assembled_delta = int(current_max_stock - previous_max_stock) if pd.notna(previous_max_stock) and pd.notna(current_max_stock) else None
-        
-        installed_delta = int(df_historial_filtered['modules_installed'].sum())
-        positions_delta = df_historial_filtered['position'].nunique()
+        period = period_metrics(df_stock, df_historial, {'Custom': (start_date, end_date, False)}).iloc[0]
+    else:
+        period = period_table.loc[selected_filter]
 
+    if isinstance(filter_value, pd.DateOffset):
+        df_historial_filtered = df_historial[df_historial['install_date'] > period['start']]
     else:
-        # For specific quarters
-        start_date, end_date = filter_value
-        # Filter dataframes based on start_date and end_date
-        df_stock_filtered = df_stock[(df_stock['date'] >= start_date) & (df_stock['date'] <= end_date)]
-        df_historial_filtered = df_historial[(df_historial['install_date'] >= start_date) & (df_historial['install_date'] <= end_date)]
+        df_historial_filtered = df_historial[(df_historial['install_date'] >= period['start']) &
+                                             (df_historial['install_date'] <= period['end'])]
 
-        # Calculate deltas within the quarter
-        assembled_delta = int(df_stock_filtered['UMD_number'].max() - df_stock[df_stock['date'] < start_date]['UMD_number'].max()) if not df_stock_filtered.empty and not df_stock[df_stock['date'] < start_date].empty else int(df_stock_filtered['UMD_number'].max()) if not df_stock_filtered.empty else 0
-        installed_delta = int(df_historial_filtered['modules_installed'].sum())
-        positions_delta = df_historial_filtered['position'].nunique()
+    assembled_delta = int(period['assembled']) if pd.notna(period['assembled']) else None
+    installed_delta = int(period['installed'])
+    positions_delta = int(period['positions'])
 else:
     # For all time, no deltas, use original dataframes
-    df_stock_filtered = df_stock
     df_historial_filtered = df_historial
     assembled_delta = None
     installed_delta = None
@@ -208,55 +142,41 @@ col4.metric(
     value=f"{(installation_positions/72 *100):.1f}%"
 )
 
+# Quarter by quarter comparison, from the same period metrics
+st.markdown(f"#### {translations['stats_quarter_table'][st.session_state['language']]}")
+st.dataframe(
+    period_table.loc[sorted_quarter_keys, ['assembled', 'installed', 'positions']],
+    use_container_width=True,
+    column_config={
+        "assembled": st.column_config.NumberColumn(translations['stats_assembled'][st.session_state['language']], format="%d"),
+        "installed": st.column_config.NumberColumn(translations['stats_installed'][st.session_state['language']], format="%d"),
+        "positions": st.column_config.NumberColumn(translations['stats_positions'][st.session_state['language']], format="%d"),
+    }
+)
+
 # Plots
 st.markdown(f"### {translations['stats_plots_title'][st.session_state['language']]}")
 
-# Create a date range from min to max date of complete dataset
+# Draw only the dates where the totals change, as steps (WebGL keeps long histories light)
 if not df_stock.empty and not df_historial.empty:
-    date_range = pd.date_range(
-        start=min(df_stock['date'].min(), df_historial['install_date'].min()),
-        end=max(df_stock['date'].max(), df_historial['install_date'].max()),
-        freq='D'
-    )
-    
-    # Prepare data for combined view
-    df_combined = pd.DataFrame({'date': date_range})
-    
-    # Add assembly data
-    df_combined = pd.merge_asof(
-        df_combined,
-        df_stock[['date', 'UMD_number']],
-        on='date',
-        direction='backward'
-    )
-    
-    # Count cumulative installations per date
-    installation_counts = df_historial.groupby('install_date')['modules_installed'].sum().reset_index()
-    installation_counts.columns = ['date', 'daily_installations']
-    installation_counts['cumulative_installations'] = installation_counts['daily_installations'].cumsum()
-    
-    # Add installation data
-    df_combined = pd.merge_asof(
-        df_combined,
-        installation_counts[['date', 'cumulative_installations']],
-        on='date',
-        direction='backward'
-    )
-    
-    # Fill NaN values with previous values or 0
-    df_combined = df_combined.fillna(method='ffill').fillna(0)
+    timeline_start = min(df_stock['date'].min(), df_historial['install_date'].min())
+    timeline_end = max(df_stock['date'].max(), df_historial['install_date'].max())
+
+    # Cumulative totals, cached per data version and extended as rows are added
+    df_combined = cumulative_timeline(df_stock, df_historial)
+    series = {
+        'Assembled': step_points(df_combined['date'].values, df_combined['UMD_number'].values,
+                                 timeline_start, timeline_end),
+        'Installed': step_points(df_combined['date'].values, df_combined['cumulative_installations'].values,
+                                 timeline_start, timeline_end),
+    }
 
     # Create the combined plot
-    fig = px.line(df_combined,
-                x='date',
-                y=['UMD_number', 'cumulative_installations'],
-                title=translations['stats_combined_title'][st.session_state['language']],
-                labels={
-                    'date': 'Date',
-                    'value': 'Number of UMDs',
-                    'variable': 'Type'
-                })
-    
+    fig = go.Figure()
+    for name, (dates, values) in series.items():
+        dates, values = downsample(dates, values)
+        fig.add_trace(go.Scattergl(x=dates, y=values, name=name, mode='lines+markers', line_shape='hv'))
+
     # Add shaded periods
     for period in SHADED_PERIODS:
         fig.add_vrect(
@@ -271,9 +191,9 @@ if not df_stock.empty and not df_historial.empty:
             showlegend=True
         )
     
-    fig.update_traces(mode='lines+markers')
     fig.update_layout(
         title=translations['stats_combined_title'][st.session_state['language']],
+        xaxis_title="Date",
         yaxis_title="Number of UMDs",
         legend_title="Type",
         showlegend=True,
@@ -285,10 +205,6 @@ if not df_stock.empty and not df_historial.empty:
         )
     )
     
-    # Update legend labels
-    newnames = {'UMD_number': 'Assembled', 'cumulative_installations': 'Installed'}
-    fig.for_each_trace(lambda t: t.update(name=newnames[t.name] if t.name in newnames else t.name))
-    
     st.plotly_chart(fig, use_container_width=True)
 else:
     st.info("No data available")
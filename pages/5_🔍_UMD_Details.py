@@ -1,11 +1,11 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import plotly.graph_objects as go
-from streamlit_gsheets import GSheetsConnection
 from translations import lang_content as translations
 from navigation import make_sidebar
-from utils import scintillator_mapping, create_umd_position_plot, check_login
+from utils import create_umd_layout_plot, create_umd_position_plot, check_login
+from data_loader import load_sheets, show_data_status, frame_version
+from geometry import get_geometry
 import re
 
 # Check if user is logged in, redirect to home page if not
@@ -15,34 +15,13 @@ make_sidebar()
 
 st.header(translations['tab_umd_details'][st.session_state['language']], divider="grey")
 
+# Get UMD details and installation history data, fetched together
+df_umd, df_historial = load_sheets("umd_details", "stats_historial")
+show_data_status("umd_details", "stats_historial")
+
 # Create two main columns
 colA, empty1, colB = st.columns((0.24, 0.04, 0.72))
 
-conn = st.connection("umd_details", type=GSheetsConnection)
-
-# Get data from the spreadsheet
-df_umd = conn.read(usecols=[0, 2])  # Columns A and C
-df_umd.columns = ['UMD_ID', 'Details']
-
-# Get installation history data
-conn_historial = st.connection("stats_historial", type=GSheetsConnection)
-df_historial = conn_historial.read(
-    usecols=[2, 3, 6, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 31, 32, 33],  # name, id, install_date, id_m101, id_m102, id_m103, RotationAngle_m101, RadioDistance_m101, PositionAngle_m101, RotationAngle_m102, RadioDistance_m102, PositionAngle_m102, RotationAngle_m103, RadioDistance_m103, PositionAngle_m103
-    names=['position', 'id', 'install_date', 
-    'id_m101', 'RotationAngle_m101', 'RadioDistance_m101', 'PositionAngle_m101',
-    'id_m102', 'RotationAngle_m102', 'RadioDistance_m102', 'PositionAngle_m102',
-    'id_m103', 'RotationAngle_m103', 'RadioDistance_m103', 'PositionAngle_m103',
-    'ekit_m101', 'ekit_m102', 'ekit_m103'],
-    header=None,
-    skiprows=7
-)
-
-# Clean installation data
-df_historial = df_historial[~df_historial["install_date"].str.contains("-", na=False)]  # Remove not installed
-df_historial['install_date'] = pd.to_datetime(df_historial['install_date'])  # Convert install_date to datetime
-df_historial = df_historial.dropna(subset=['install_date'])  # Remove rows without install date
-df_historial['id'] = df_historial['id'].astype(int)
-
 with colA:
     st.header(translations['filters_header'][st.session_state['language']], divider="grey")
 
@@ -90,17 +69,11 @@ with colA:
         if not matching_rows.empty:
             selected_row = matching_rows.iloc[0]
             
-            # Get installation info by searching in all module columns
-            umd_info = df_historial[
-                (df_historial['id_m101'] == selected_umd) |
-                (df_historial['id_m102'] == selected_umd) |
-                (df_historial['id_m103'] == selected_umd)
-            ].iloc[0] if len(df_historial[
-                (df_historial['id_m101'] == selected_umd) |
-                (df_historial['id_m102'] == selected_umd) |
-                (df_historial['id_m103'] == selected_umd)
-            ]) > 0 else None
-            
+            # Get installation info by searching the module ids of every installation
+            geometry = get_geometry(df_historial, frame_version(df_historial))
+            installations = np.flatnonzero((geometry['ids'] == selected_umd).any(axis=1))
+            umd_info = df_historial.iloc[installations[0]] if len(installations) > 0 else None
+
             if umd_info is not None:
                 # Find which module number this UMD is
                 module_num = None
@@ -167,94 +140,12 @@ with colB:
                 numbers = re.findall(r'\d+', details_text)
                 problematic_scints = [int(num) for num in numbers]
             
-            # UMD visualization parameters
-            umd_width = 1.28
-            scint_num = 32
-            scint_width = umd_width / scint_num
-            scint_length = 0.5
-            scint_offset = 0.25
-            
-            # Create sample data for scintillators
-            df_top = pd.DataFrame({
-                'x': np.linspace(-umd_width/2, umd_width/2 - scint_width, scint_num)
-            })
-
-            df_bottom = pd.DataFrame({
-                'x': np.linspace(-umd_width/2, umd_width/2 - scint_width, scint_num)
-            })
-
-            # Create the figure
-            fig = go.Figure()
-            
-            # Add top scintillators (numbered 1-32 from left to right)
-            for i in range(len(df_top)):
-                scint_num = i + 1  # Numbers 1-32
-                fillcolor = "red" if scint_num in problematic_scints else "white"
-                
-                fig.add_trace(go.Scatter(
-                    x=[df_top['x'][i], df_top['x'][i], df_top['x'][i] + scint_width, df_top['x'][i] + scint_width, df_top['x'][i]],
-                    y=[scint_offset, scint_offset + scint_length, scint_offset + scint_length, scint_offset, scint_offset],
-                    fill="toself",
-                    fillcolor=fillcolor,
-                    line=dict(color="Black", width=1),
-                    hoverinfo="text",
-                    text=f"Scintillator: {scint_num}<br>FPGA Channel: {scintillator_mapping[scint_num]['fpga']}<br>Data Channel: {scintillator_mapping[scint_num]['datos']}",
-                    showlegend=False
-                ))
-
-            # Add bottom scintillators (numbered 33-64 from right to left)
-            for i in range(len(df_bottom)):
-                scint_num = 64 - i  # Numbers 64-33 from right to left
-                fillcolor = "red" if scint_num in problematic_scints else "white"
-                
-                fig.add_trace(go.Scatter(
-                    x=[df_bottom['x'][i], df_bottom['x'][i], df_bottom['x'][i] + scint_width, df_bottom['x'][i] + scint_width, df_bottom['x'][i]],
-                    y=[-scint_offset, -scint_offset - scint_length, -scint_offset - scint_length, -scint_offset, -scint_offset],
-                    fill="toself",
-                    fillcolor=fillcolor,
-                    line=dict(color="Black", width=1),
-                    hoverinfo="text",
-                    text=f"Scintillator: {scint_num}<br>FPGA Channel: {scintillator_mapping[scint_num]['fpga']}<br>Data Channel: {scintillator_mapping[scint_num]['datos']}",
-                    showlegend=False
-                ))
-
-            # Add central circle
-            fig.add_shape(
-                type="circle",
-                xref="x",
-                yref="y",
-                x0=-0.15,
-                y0=-0.15,
-                x1=0.15,
-                y1=0.15,
-                fillcolor="lightblue",
-                opacity=0.7
-            )
-
-            # Update layout
-            fig.update_layout(
-                xaxis=dict(
-                    scaleanchor="y",
-                    scaleratio=1,
-                    showgrid=False,
-                    zeroline=False,
-                    showticklabels=False
-                ),
-                yaxis=dict(
-                    showgrid=False,
-                    zeroline=False,
-                    showticklabels=False
-                ),
-                width=600,
-                height=800,
-                showlegend=False,
-                hovermode='closest'
-            )
+            fig = create_umd_layout_plot(problematic_scints)
             st.plotly_chart(fig, use_container_width=True)
         
         with plot_col2:
             st.markdown(f"### {translations['umd_position_header'][st.session_state['language']]}")
-            position_fig = create_umd_position_plot(umd_info, selected_umd)
+            position_fig = create_umd_position_plot(df_historial, installations[0], selected_umd)
             if position_fig is not None:
                 st.plotly_chart(position_fig, use_container_width=True)
             else:
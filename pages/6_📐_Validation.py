@@ -0,0 +1,47 @@
+import streamlit as st
+from translations import lang_content as translations
+from navigation import make_sidebar
+from utils import check_login
+from data_loader import load_sheet, show_data_status, frame_version
+from geometry import get_geometry, validate_installations
+from query_filter import cached_filter
+
+# Check if user is logged in, redirect to home page if not
+if not check_login():
+    st.stop()
+make_sidebar()
+
+st.header(translations['tab_validation_title'][st.session_state['language']], divider="grey")
+
+df_historial = load_sheet("stats_historial")
+show_data_status("stats_historial")
+version = frame_version(df_historial)
+
+# Every module of every installation is checked at once, once per dataset version
+issues = cached_filter(version, ('validation',),
+                       lambda: validate_installations(df_historial, get_geometry(df_historial, version)))
+
+st.caption(translations['validation_caption'][st.session_state['language']])
+
+col1, col2, col3, col4 = st.columns(4)
+col1.metric(translations['validation_overlap'][st.session_state['language']], int((issues['overlap'] != '').sum()))
+col2.metric(translations['validation_tank'][st.session_state['language']], int(issues['tank'].sum()))
+col3.metric(translations['validation_outside'][st.session_state['language']], int(issues['outside_margin'].sum()))
+col4.metric(translations['validation_unparsable'][st.session_state['language']], int(issues['unparsable'].sum()))
+
+if len(issues) == 0:
+    st.success(translations['validation_ok'][st.session_state['language']])
+else:
+    st.dataframe(issues, hide_index=True, use_container_width=True, column_config={
+        "position": translations['position_label'][st.session_state['language']],
+        "install_date": st.column_config.DateColumn(translations['install_date_label'][st.session_state['language']],
+                                                    format="YYYY-MM-DD"),
+        "module": translations['module_position_label'][st.session_state['language']],
+        "umd": "UMD",
+        "overlap": translations['validation_overlap'][st.session_state['language']],
+        "tank": st.column_config.CheckboxColumn(translations['validation_tank'][st.session_state['language']]),
+        "outside_margin": st.column_config.CheckboxColumn(translations['validation_outside'][st.session_state['language']]),
+        "unparsable": st.column_config.CheckboxColumn(translations['validation_unparsable'][st.session_state['language']]),
+        "max_distance": st.column_config.NumberColumn(translations['validation_distance'][st.session_state['language']],
+                                                      format="%.2f m"),
+    })
@@ -0,0 +1,300 @@
+import os
+import re
+import io
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from PIL import Image
+
+# Directory holding the downloaded report photos.
+# Override with the UMD_PHOTO_CACHE_DIR environment variable.
+PHOTO_CACHE_DIR = os.environ.get(
+    "UMD_PHOTO_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".photo_cache")
+)
+
+# Maximum size of the photo cache in bytes (UMD_PHOTO_CACHE_MB, default 500 MB)
+PHOTO_CACHE_BYTES = int(os.environ.get("UMD_PHOTO_CACHE_MB", 500)) * 1024 * 1024
+
+# Photos downloaded at the same time
+PHOTO_WORKERS = 8
+
+# Reports whose photos are preloaded, the bytes a preload may read, and the
+# workers shared by all preloads (kept low so they never slow down clicks)
+PREFETCH_REPORTS = 10
+PREFETCH_BYTES = 50 * 1024 * 1024
+PREFETCH_WORKERS = 2
+
+# Seconds to wait for Google Drive to connect and between bytes received
+PHOTO_TIMEOUT = (5, 30)
+
+# Bounding box and JPEG quality of the photos shown in the report panel
+THUMBNAIL_SIZE = (800, 800)
+THUMBNAIL_QUALITY = 80
+
+# Leading bytes of the image formats browsers display as they are
+BROWSER_FORMATS = {
+    b'\xff\xd8\xff': 'JPEG',
+    b'\x89PNG\r\n\x1a\n': 'PNG',
+    b'GIF87a': 'GIF',
+    b'GIF89a': 'GIF',
+}
+
+FILE_ID_RE = re.compile(r'id=([\w-]+)')
+
+_lock = threading.Lock()
+_entries = None  # file name -> size in bytes, least recently used first
+_total = 0
+_stats = Counter()
+
+# Downloads in progress, keyed by file id, shared by concurrent requests
+_inflight = {}
+_flight_lock = threading.Lock()
+
+# Shared keep-alive connections and workers for all sessions
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=PHOTO_WORKERS, pool_maxsize=PHOTO_WORKERS))
+_photo_pool = ThreadPoolExecutor(max_workers=PHOTO_WORKERS, thread_name_prefix="photo-fetch")
+_prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="photo-prefetch")
+
+
+def drive_file_id(drive_link):
+    """Google Drive file id of a photo link."""
+    match = FILE_ID_RE.search(drive_link)
+    if match is None:
+        raise ValueError(f"Not a Google Drive link: {drive_link}")
+    return match.group(1)
+
+
+def _path(key):
+    return os.path.join(PHOTO_CACHE_DIR, key)
+
+
+def _load_entries():
+    """Index the files already on disk, oldest access first (call with _lock held)."""
+    global _entries, _total
+    if _entries is not None:
+        return
+    os.makedirs(PHOTO_CACHE_DIR, exist_ok=True)
+    files = []
+    for entry in os.scandir(PHOTO_CACHE_DIR):
+        if entry.is_file() and not entry.name.endswith('.tmp'):
+            stat = entry.stat()
+            files.append((stat.st_mtime, entry.name, stat.st_size))
+    _entries = OrderedDict((name, size) for _, name, size in sorted(files))
+    _total = sum(_entries.values())
+
+
+def _evict():
+    """Remove the least recently used photos until the cache fits (call with _lock held)."""
+    global _total
+    while _total > PHOTO_CACHE_BYTES and len(_entries) > 1:
+        name, size = _entries.popitem(last=False)
+        _total -= size
+        _stats['evictions'] += 1
+        try:
+            os.remove(_path(name))
+        except OSError:
+            pass
+
+
+def _forget(key):
+    global _total
+    size = _entries.pop(key, None)
+    if size is not None:
+        _total -= size
+
+
+def cache_get(key):
+    """Bytes stored under a key, or None. Hits are read from disk only."""
+    with _lock:
+        _load_entries()
+        if key not in _entries:
+            _stats['misses'] += 1
+            return None
+        _entries.move_to_end(key)
+    try:
+        with open(_path(key), 'rb') as f:
+            data = f.read()
+        # The access time orders the entries again after a restart
+        os.utime(_path(key))
+    except OSError:
+        with _lock:
+            _stats['misses'] += 1
+            _forget(key)
+        return None
+    with _lock:
+        _stats['hits'] += 1
+    return data
+
+
+def cache_put(key, data):
+    """Store bytes under a key, evicting the least recently used entries if needed."""
+    global _total
+    with _lock:
+        _load_entries()
+    tmp_path = f"{_path(key)}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, _path(key))
+    with _lock:
+        _forget(key)
+        _entries[key] = len(data)
+        _total += len(data)
+        _evict()
+
+
+def is_cached(key):
+    with _lock:
+        _load_entries()
+        return key in _entries
+
+
+def photo_cache_stats():
+    """Hits, misses and evictions since start, and the current cache size."""
+    with _lock:
+        _load_entries()
+        return {**_stats, 'photos': len(_entries), 'bytes': _total}
+
+
+def download_photo(file_id):
+    """Download the original of a Drive photo."""
+    url = f"https://drive.google.com/uc?export=view&id={file_id}"
+    response = _session.get(url, timeout=PHOTO_TIMEOUT)
+    if response.status_code == 404:
+        raise Exception("Image not found. It may have been deleted or is not publicly accessible.")
+    response.raise_for_status()
+    if response.headers.get('Content-Type', '').startswith('text/'):
+        # Drive answers with a web page when the file is not shared as an image
+        raise Exception("The link did not return an image. It may not be publicly accessible.")
+    return response.content
+
+
+def get_photo_bytes(drive_link):
+    """
+    Original bytes of a Drive photo, from the cache when possible. Concurrent
+    requests for the same photo share a single download.
+    """
+    file_id = drive_file_id(drive_link)
+    data = cache_get(file_id)
+    if data is not None:
+        return data
+
+    with _flight_lock:
+        future = _inflight.get(file_id)
+        leader = future is None
+        if leader:
+            future = _inflight[file_id] = Future()
+    if not leader:
+        return future.result()
+
+    try:
+        data = download_photo(file_id)
+        cache_put(file_id, data)
+        future.set_result(data)
+        return data
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _flight_lock:
+            del _inflight[file_id]
+
+
+def browser_format(data):
+    """Format of image bytes a browser can show without conversion, or None."""
+    if data[8:12] == b'WEBP' and data[:4] == b'RIFF':
+        return 'WEBP'
+    for magic, fmt in BROWSER_FORMATS.items():
+        if data.startswith(magic):
+            return fmt
+    return None
+
+
+def display_photo(data):
+    """
+    Image bytes ready for st.image. Formats browsers understand are passed
+    through untouched; anything else (TIFF, BMP, ...) is converted to JPEG.
+    """
+    if browser_format(data):
+        return data
+    img = Image.open(io.BytesIO(data))
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    out = io.BytesIO()
+    img.save(out, format='JPEG')
+    return out.getvalue()
+
+
+def make_thumbnail(data):
+    """Downscaled JPEG rendition of an image."""
+    # Opening only reads the header: small JPEGs are used as they are
+    img = Image.open(io.BytesIO(data))
+    if browser_format(data) == 'JPEG' and img.width <= THUMBNAIL_SIZE[0] and img.height <= THUMBNAIL_SIZE[1]:
+        return data
+
+    # JPEGs are decoded directly at a reduced scale
+    img.draft('RGB', THUMBNAIL_SIZE)
+    img.thumbnail(THUMBNAIL_SIZE)
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+def get_thumbnail(drive_link):
+    """Thumbnail of a Drive photo, generated once and kept in the cache."""
+    key = f"{drive_file_id(drive_link)}.thumb"
+    data = cache_get(key)
+    if data is None:
+        data = make_thumbnail(get_photo_bytes(drive_link))
+        cache_put(key, data)
+    return data
+
+
+def fetch_photos(links, load=get_photo_bytes):
+    """
+    Run load(link) for every link concurrently. Yields (position, result, error)
+    as each one finishes, so photos can be shown while the others download.
+    """
+    futures = {_photo_pool.submit(load, link): i for i, link in enumerate(links)}
+    for future in as_completed(futures):
+        try:
+            yield futures[future], future.result(), None
+        except Exception as e:
+            yield futures[future], None, e
+
+
+def _prefetch(links, cancel):
+    spent = 0
+    for link in links:
+        if cancel.is_set() or spent >= PREFETCH_BYTES:
+            return
+        try:
+            file_id = drive_file_id(link)
+            if is_cached(f"{file_id}.thumb"):
+                continue
+            # Only downloads count against the budget, not originals already cached
+            downloaded = not is_cached(file_id)
+            data = get_photo_bytes(link)
+            if downloaded:
+                spent += len(data)
+            get_thumbnail(link)
+            with _lock:
+                _stats['prefetched'] += 1
+        except Exception as e:
+            print(f"Error preloading photo {link}: {str(e)}")
+
+
+def prefetch_photos(links):
+    """
+    Warm the cache with the photos and thumbnails of links, in order, on the
+    low priority pool until PREFETCH_BYTES were downloaded. Returns an Event that
+    stops the preload when set.
+    """
+    cancel = threading.Event()
+    _prefetch_pool.submit(_prefetch, list(links), cancel)
+    return cancel
@@ -0,0 +1,52 @@
+import time
+import threading
+import streamlit as st
+from data_loader import SHEETS, refresh_sheets, next_refresh, load_snapshots, fetch_stats
+from photo_cache import photo_cache_stats
+
+# Longest sleep between two checks, so manual refreshes are picked up
+POLL_INTERVAL = 30
+
+# Seconds between two reports of the fetch and photo cache counters in the server log
+STATS_INTERVAL = 3600
+
+
+def _log_stats():
+    for name, counters in sorted(fetch_stats().items()):
+        print(f"Sheet {name}: " + ", ".join(f"{counter} {count}" for counter, count in sorted(counters.items())))
+    photos = photo_cache_stats()
+    print(f"Photo cache: {photos['photos']} photos, {photos['bytes'] / 2**20:.1f} MB, "
+          f"hits {photos.get('hits', 0)}, misses {photos.get('misses', 0)}, evictions {photos.get('evictions', 0)}")
+
+
+def _run():
+    """Refresh every sheet when it is due, forever."""
+    # Serve the stored copies right away, then refresh what is out of date
+    load_snapshots()
+    stats_at = time.time()
+    while True:
+        due = [name for name in SHEETS if next_refresh(name) <= time.time()]
+        if due:
+            try:
+                refresh_sheets(due)
+            except Exception as e:  # Never let an error stop the loop
+                print(f"Error in prefetcher: {str(e)}")
+
+        if time.time() - stats_at >= STATS_INTERVAL:
+            stats_at = time.time()
+            _log_stats()
+
+        wait = min(next_refresh(name) for name in SHEETS) - time.time()
+        time.sleep(min(max(wait, 1), POLL_INTERVAL))
+
+
+@st.cache_resource(show_spinner=False)
+def start_prefetcher():
+    """
+    Start the background refresh of all sheets.
+    Cached as a resource so there is a single prefetcher per server process,
+    started by the first script run (usually the login page).
+    """
+    thread = threading.Thread(target=_run, name="sheet-prefetcher", daemon=True)
+    thread.start()
+    return thread
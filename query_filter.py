@@ -0,0 +1,194 @@
+import re
+import threading
+import numpy as np
+import pandas as pd
+from cachetools import LRUCache
+from search_index import fold
+from utils import search_dataframe, fuzzy_search_dataframe
+
+# Fields accepted in the search box of each page, mapped to their column
+FIELD_WORK_FIELDS = {'position': 'name', 'type': 'type', 'team': 'team', 'id': 'id'}
+ACQUISITION_FIELDS = {'position': 'position', 'status': 'status', 'team': 'team',
+                      'modules': 'modules', 'summary': 'summary'}
+
+# Qualifiers that bound the date column
+DATE_QUALIFIERS = {'after', 'before'}
+
+QUERY_TOKEN_RE = re.compile(r'(\w+):("[^"]*"|\S+)|("[^"]*"|\S+)')
+
+# Number of filter results kept in memory, shared by all sessions
+FILTER_CACHE_SIZE = 128
+
+_filter_cache = LRUCache(maxsize=FILTER_CACHE_SIZE)
+_filter_lock = threading.Lock()
+
+
+def parse_query(query, fields):
+    """
+    Split a search box query such as `position:Kathy type:repair after:2024-01-01 "PMT"`
+    into field filters ({column: [values]}), date bounds and the remaining free text.
+    Qualifiers that cannot be understood are returned in 'invalid'.
+    """
+    parsed = {'fields': {}, 'after': None, 'before': None, 'text': [], 'invalid': []}
+    for field, value, text in QUERY_TOKEN_RE.findall(query or ''):
+        if not field:
+            parsed['text'].append(text)
+            continue
+
+        field = field.lower()
+        value = value.strip('"')
+        if field in DATE_QUALIFIERS:
+            date = pd.to_datetime(value, errors='coerce')
+            if pd.isna(date):
+                parsed['invalid'].append(f"{field}:{value}")
+            else:
+                parsed[field] = date
+        elif field in fields:
+            parsed['fields'].setdefault(fields[field], []).append(value)
+        else:
+            # Not a known field (e.g. a URL): search it as text
+            parsed['text'].append(f"{field}:{value}")
+
+    parsed['text'] = ' '.join(parsed['text'])
+    return parsed
+
+
+def _codes(series):
+    """Integer codes of a column and the labels they stand for."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.values, series.cat.categories
+    return pd.factorize(series)
+
+
+def contains_mask(series, values):
+    """
+    Rows whose value contains any of the given texts, ignoring case and accents.
+    Each distinct value is checked once, rows are then selected by their code.
+    """
+    codes, labels = _codes(series)
+    wanted = [fold(v) for v in values]
+    matching = [i for i, label in enumerate(labels) if any(w in fold(str(label)) for w in wanted)]
+    return np.isin(codes, matching)
+
+
+def equals_mask(series, value):
+    """Rows equal to a value (None selects every row)."""
+    if value is None:
+        return np.ones(len(series), dtype=bool)
+    codes, labels = _codes(series)
+    matching = np.flatnonzero(labels == value)
+    return np.isin(codes, matching)
+
+
+def facet_counts(df, columns, mask):
+    """
+    Number of selected rows for every value of the given columns, counted with
+    one bincount over the category codes. Returns {column: Series of counts}
+    in category order, without the values that have no rows.
+    """
+    counts = {}
+    for column in columns:
+        codes, labels = _codes(df[column])
+        totals = np.bincount(codes[mask & (codes >= 0)], minlength=len(labels))
+        present = totals > 0
+        counts[column] = pd.Series(totals[present], index=labels[present])
+    return counts
+
+
+def cross_facet_counts(df, mask, selections):
+    """
+    Counts of every facet dropdown under all the other filters: the mask
+    (search box, dates) and the selections of the other facets, leaving out
+    the facet's own. selections maps a column to its selected value (None for
+    all); a selected value without rows is kept with a count of 0.
+    The counts are needed before the dropdowns and date inputs are drawn, so
+    pages pass the values those widgets had in the session.
+    """
+    selected = {column: equals_mask(df[column], value) for column, value in selections.items()}
+    counts = {}
+    for column, value in selections.items():
+        others = mask.copy()
+        for other, other_mask in selected.items():
+            if other != column:
+                others &= other_mask
+        counts[column] = facet_counts(df, [column], others)[column]
+        if value is not None and value not in counts[column].index:
+            counts[column] = pd.concat([counts[column], pd.Series([0], index=[value])])
+    return counts
+
+
+def facet_label(counts):
+    """format_func for a facet dropdown, showing options as 'Kathy Turner (37)'."""
+    return lambda value: f"{value} ({counts.get(value, 0)})"
+
+
+def date_mask(series, start=None, end=None):
+    """Rows whose date falls between two days, both included (None leaves it open)."""
+    days = pd.to_datetime(series).values.astype('datetime64[D]')
+    mask = ~np.isnat(days)
+    if start is not None:
+        mask &= days >= np.datetime64(pd.Timestamp(start).date(), 'D')
+    if end is not None:
+        mask &= days <= np.datetime64(pd.Timestamp(end).date(), 'D')
+    return mask
+
+
+def query_mask(df, parsed, date_column, fuzzy=False):
+    """
+    Evaluate a parsed query on a dataframe in one pass.
+    Returns (mask, scores): the boolean array of matching rows and, for a fuzzy
+    free text search, the relevance score of every row (None otherwise).
+    """
+    mask = np.ones(len(df), dtype=bool)
+    for column, values in parsed['fields'].items():
+        mask &= contains_mask(df[column], values)
+    if parsed['after'] is not None or parsed['before'] is not None:
+        mask &= date_mask(df[date_column], parsed['after'], parsed['before'])
+
+    scores = None
+    if parsed['text']:
+        if fuzzy:
+            scores = fuzzy_search_dataframe(df, parsed['text'])
+            mask &= scores.values > 0
+        else:
+            mask &= search_dataframe(df, parsed['text']).values
+    return mask, scores
+
+
+def run_search(df, query, fields, date_column, fuzzy=False):
+    """
+    Apply a search box query. The returned mask selects every row when the
+    query has no matches, so the other filters still have something to show.
+    """
+    result = {'mask': np.ones(len(df), dtype=bool), 'scores': None, 'invalid': [], 'matches': None}
+    if not query:
+        return result
+
+    parsed = parse_query(query, fields)
+    mask, scores = query_mask(df, parsed, date_column, fuzzy)
+    result['invalid'] = parsed['invalid']
+    result['matches'] = int(mask.sum())
+    if result['matches']:
+        result['mask'], result['scores'] = mask, scores
+    return result
+
+
+def cached_filter(version, filters, compute):
+    """
+    Return compute() memoized by (dataset version, filter state), so reruns
+    that do not change the filters (row selection, report panel) reuse the
+    result. Pages run each step of their filters (search box, facet counts,
+    final table) through it. Results are shared between sessions and must not
+    be modified.
+    """
+    if version is None:
+        return compute()
+
+    key = (version, filters)
+    with _filter_lock:
+        result = _filter_cache.get(key)
+    if result is None:
+        result = compute()
+        with _filter_lock:
+            _filter_cache[key] = result
+    return result
@@ -0,0 +1,221 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict, defaultdict
+import numpy as np
+
+# Separates the columns of a row in its searchable text, so a query never
+# matches across two columns
+COLUMN_SEPARATOR = "\x1f"
+
+TOKEN_RE = re.compile(r"\w+")
+QUERY_TERM_RE = re.compile(r'"([^"]+)"|(\S+)')
+
+# Number of indexes kept in memory (one per dataset version and column set)
+MAX_INDEXES = 8
+
+# Minimum trigram similarity (0 to 1) for a word to match in fuzzy search
+FUZZY_THRESHOLD = 0.5
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def normalize(text):
+    return text.casefold()
+
+
+def fold(text):
+    """Normalise for fuzzy matching: casefold and strip accents."""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def _trigrams(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+def _padded_trigrams(word):
+    """Trigrams of a word padded with spaces, so word starts and ends weigh more."""
+    return _trigrams(f"  {word} ")
+
+
+def row_texts(df):
+    """Searchable text of every row: all columns as text, empty values skipped."""
+    columns = [df[col].astype(str).where(df[col].notna(), '') for col in df.columns]
+    if not columns:
+        return np.array([''] * len(df), dtype=object)
+    texts = columns[0].str.cat(columns[1:], sep=COLUMN_SEPARATOR)
+    return np.array([normalize(text) for text in texts], dtype=object)
+
+
+def build_search_index(df):
+    """
+    Build an inverted index over the normalised text of every row:
+    token -> rows containing it, and trigram -> tokens containing it.
+    """
+    texts = row_texts(df)
+
+    token_rows = defaultdict(list)
+    for row, text in enumerate(texts):
+        for token in set(TOKEN_RE.findall(text)):
+            token_rows[token].append(row)
+
+    vocabulary = list(token_rows)
+    grams = defaultdict(list)
+    for token_id, token in enumerate(vocabulary):
+        for gram in _trigrams(token):
+            grams[gram].append(token_id)
+
+    return {
+        'texts': texts,
+        'vocabulary': vocabulary,
+        'rows': [np.array(token_rows[token], dtype=np.int32) for token in vocabulary],
+        'grams': {gram: np.array(ids, dtype=np.int32) for gram, ids in grams.items()},
+    }
+
+
+def get_search_index(df, version):
+    """Return the index of a dataframe, built once per dataset version."""
+    key = (version, tuple(df.columns))
+    with _lock:
+        if key in _indexes:
+            _indexes.move_to_end(key)
+            return _indexes[key]
+
+    index = build_search_index(df)
+    with _lock:
+        _indexes[key] = index
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def _tokens_containing(index, fragment):
+    """Ids of the indexed tokens that contain a fragment."""
+    vocabulary = index['vocabulary']
+    if len(fragment) < 3:
+        return [i for i, token in enumerate(vocabulary) if fragment in token]
+
+    postings = [index['grams'].get(gram) for gram in _trigrams(fragment)]
+    if any(p is None for p in postings):
+        return []
+    candidates = postings[0]
+    for p in sorted(postings[1:], key=len):
+        candidates = np.intersect1d(candidates, p, assume_unique=True)
+    return [i for i in candidates if fragment in vocabulary[i]]
+
+
+def _term_mask(index, term):
+    n = len(index['texts'])
+    fragments = TOKEN_RE.findall(term)
+    if not fragments:
+        # Only punctuation: nothing indexed, check the row texts directly
+        return np.array([term in text for text in index['texts']], dtype=bool)
+
+    mask = np.ones(n, dtype=bool)
+    for fragment in fragments:
+        token_ids = _tokens_containing(index, fragment)
+        fragment_mask = np.zeros(n, dtype=bool)
+        if token_ids:
+            fragment_mask[np.concatenate([index['rows'][i] for i in token_ids])] = True
+        mask &= fragment_mask
+
+    if fragments != [term]:
+        # Several words or punctuation: confirm the exact text on the candidates
+        for row in np.flatnonzero(mask):
+            mask[row] = term in index['texts'][row]
+    return mask
+
+
+def parse_terms(query):
+    """Split a query into terms; quoted text is kept as a single term."""
+    return [normalize(quoted or word) for quoted, word in QUERY_TERM_RE.findall(query)]
+
+
+def search_index(index, query):
+    """Boolean array of the rows containing every term of the query."""
+    mask = np.ones(len(index['texts']), dtype=bool)
+    for term in parse_terms(query):
+        mask &= _term_mask(index, term)
+    return mask
+
+
+def _fuzzy_index(index):
+    """
+    Character n-gram index over the accent-folded vocabulary, built on the
+    first fuzzy query and stored in the search index.
+    """
+    if 'fuzzy' in index:
+        return index['fuzzy']
+
+    token_ids = defaultdict(list)
+    for token_id, token in enumerate(index['vocabulary']):
+        token_ids[fold(token)].append(token_id)
+    vocabulary = list(token_ids)
+
+    grams = defaultdict(list)
+    for word_id, word in enumerate(vocabulary):
+        for gram in _padded_trigrams(word):
+            grams[gram].append(word_id)
+
+    fuzzy = {
+        'vocabulary': vocabulary,
+        'rows': [index['rows'][ids[0]] if len(ids) == 1 else np.unique(np.concatenate([index['rows'][i] for i in ids]))
+                 for ids in token_ids.values()],
+        'gram_counts': np.array([len(_padded_trigrams(word)) for word in vocabulary]),
+        'grams': {gram: np.array(ids, dtype=np.int32) for gram, ids in grams.items()},
+    }
+    index['fuzzy'] = fuzzy
+    return fuzzy
+
+
+def _word_similarities(fuzzy, word):
+    """Ids of the vocabulary words similar to a query word, and their similarity."""
+    vocabulary = fuzzy['vocabulary']
+    if len(word) < 3:
+        # Too short to tolerate typos: match words starting with it
+        ids = np.array([i for i, w in enumerate(vocabulary) if w.startswith(word)], dtype=np.int64)
+        return ids, np.ones(len(ids))
+
+    query_grams = _padded_trigrams(word)
+    postings = [fuzzy['grams'][gram] for gram in query_grams if gram in fuzzy['grams']]
+    if not postings:
+        return np.array([], dtype=np.int64), np.array([])
+
+    # Dice coefficient between the trigram sets of the query and each word
+    shared = np.bincount(np.concatenate(postings), minlength=len(vocabulary))
+    ids = np.flatnonzero(shared)
+    similarity = 2 * shared[ids] / (len(query_grams) + fuzzy['gram_counts'][ids])
+
+    # Words that contain the query (prefixes while typing) always match
+    contained = np.array([word in vocabulary[i] for i in ids], dtype=bool)
+    similarity[contained] = np.maximum(similarity[contained], 0.8 + 0.2 * similarity[contained])
+
+    keep = similarity >= FUZZY_THRESHOLD
+    return ids[keep], similarity[keep]
+
+
+def fuzzy_search_index(index, query):
+    """
+    Score every row against a query, ignoring case and accents and tolerating
+    typos. Every word of the query must match a word of the row; the score is
+    the mean similarity of the best match of each word (0 for rows not matching).
+    """
+    fuzzy = _fuzzy_index(index)
+    words = TOKEN_RE.findall(fold(query))
+    n = len(index['texts'])
+    if not words:
+        return np.zeros(n)
+
+    total = np.zeros(n)
+    matched = np.ones(n, dtype=bool)
+    for word in words:
+        word_scores = np.zeros(n)
+        for word_id, similarity in zip(*_word_similarities(fuzzy, word)):
+            rows = fuzzy['rows'][word_id]
+            word_scores[rows] = np.maximum(word_scores[rows], similarity)
+        matched &= word_scores > 0
+        total += word_scores
+
+    return np.where(matched, total / len(words), 0.0)
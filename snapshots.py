@@ -0,0 +1,71 @@
+import os
+import json
+import hashlib
+import pandas as pd
+
+# Directory holding the last good copy of every sheet.
+# Override with the UMD_SNAPSHOT_DIR environment variable.
+SNAPSHOT_DIR = os.environ.get(
+    "UMD_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshots")
+)
+
+
+def frame_hash(df):
+    """Content hash of a dataframe, used to tell whether a sheet changed."""
+    row_hashes = pd.util.hash_pandas_object(df, index=False).values
+    return hashlib.sha1(row_hashes.tobytes()).hexdigest()
+
+
+def _paths(name):
+    base = os.path.join(SNAPSHOT_DIR, name)
+    return f"{base}.parquet", f"{base}.json"
+
+
+def _arrow_safe(df):
+    """Parquet needs one type per column: store mixed object columns as text."""
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        values = df[col]
+        mixed = values.notna() & ~values.map(lambda v: isinstance(v, str))
+        if mixed.any():
+            df.loc[mixed, col] = values[mixed].astype(str)
+    return df
+
+
+def save_snapshot(name, df, meta):
+    """
+    Write the frame as Parquet and its metadata (fetch timestamp, content hash)
+    as JSON. Files are replaced atomically so readers never see partial writes.
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    data_path, meta_path = _paths(name)
+
+    _arrow_safe(df).to_parquet(data_path + ".tmp", engine="pyarrow", index=False)
+    os.replace(data_path + ".tmp", data_path)
+
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def load_snapshot(name):
+    """
+    Return (df, meta) of the stored copy of a sheet, or (None, None) if there
+    is no usable snapshot.
+    """
+    data_path, meta_path = _paths(name)
+    if not os.path.exists(data_path):
+        return None, None
+    try:
+        df = pd.read_parquet(data_path, engine="pyarrow")
+    except Exception as e:
+        print(f"Error reading snapshot {name}: {str(e)}")
+        return None, None
+
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = {'fetched_at': os.path.getmtime(data_path), 'hash': frame_hash(df), 'rows': len(df)}
+    return df, meta
@@ -0,0 +1,208 @@
+import threading
+import numpy as np
+import pandas as pd
+from data_loader import frame_version
+
+# Most points drawn per series, about the pixel width of a wide chart.
+# Longer timelines are downsampled with LTTB.
+MAX_POINTS = 1500
+
+_series = {}
+_combined = {}
+_lock = threading.Lock()
+
+
+def step_points(dates, values, start=None, end=None):
+    """
+    Reduce a cumulative series to its change points: the first date of every
+    new value, plus the start (at 0) and end of the range so the steps span it.
+    """
+    dates = np.asarray(dates, dtype='datetime64[ns]')
+    values = np.asarray(values, dtype=float)
+    keep = np.ones(len(values), dtype=bool)
+    keep[1:] = values[1:] != values[:-1]
+    dates, values = dates[keep], values[keep]
+
+    if start is not None and (len(dates) == 0 or dates[0] > np.datetime64(start, 'ns')):
+        dates = np.concatenate([[np.datetime64(start, 'ns')], dates])
+        values = np.concatenate([[0.0], values])
+    if end is not None and len(dates) and dates[-1] < np.datetime64(end, 'ns'):
+        dates = np.concatenate([dates, [np.datetime64(end, 'ns')]])
+        values = np.concatenate([values, values[-1:]])
+    return dates, values
+
+
+def lttb(x, y, n):
+    """Indices of the n points kept by Largest-Triangle-Three-Buckets downsampling."""
+    size = len(x)
+    if n >= size or n < 3:
+        return np.arange(size)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, size - 1, n - 1).astype(int)
+    kept = [0]
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket (the last point for the final bucket)
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else size
+        avg_x, avg_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        a = kept[-1]
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        kept.append(lo + int(area.argmax()))
+    kept.append(size - 1)
+    return np.array(kept)
+
+
+def downsample(dates, values, n=MAX_POINTS):
+    """Keep at most n points of a series."""
+    if len(dates) <= n:
+        return dates, values
+    index = lttb(dates.astype('int64'), values, n)
+    return dates[index], values[index]
+
+
+def _per_date(dates, values, running_total):
+    """Total at the end of every distinct date: running sum of the values, or the last value."""
+    grouped = pd.Series(values, dtype=float).groupby(dates, sort=True)
+    totals = grouped.sum().cumsum() if running_total else grouped.last()
+    return totals.index.values.astype('datetime64[ns]'), totals.values
+
+
+def cumulative_series(name, dates, values, version, running_total):
+    """
+    Total of a sheet at every distinct date (dates sorted), cached per dataset
+    version. When the new rows all come after the cached ones, only they are
+    processed and the totals continue from the last cached value.
+    """
+    dates = np.asarray(dates, dtype='datetime64[ns]')
+    values = np.asarray(values, dtype=float)
+    with _lock:
+        cached = _series.get(name)
+    if cached is not None and version is not None and cached['version'] == version:
+        return cached['dates'], cached['totals']
+
+    known = len(cached['source_dates']) if cached is not None else 0
+    extends = (0 < known <= len(dates)
+               and np.array_equal(dates[:known], cached['source_dates'])
+               and np.array_equal(values[:known], cached['source_values'])
+               and (known == len(dates) or dates[known] >= cached['source_dates'][-1]))
+
+    if extends:
+        out_dates, out_totals = cached['dates'], cached['totals']
+        tail_dates, tail_totals = _per_date(dates[known:], values[known:], running_total)
+        if running_total:
+            tail_totals = tail_totals + out_totals[-1]
+        if len(tail_dates) and tail_dates[0] == out_dates[-1]:
+            # The first new rows share the last cached date, which gets a new total
+            out_dates, out_totals = out_dates[:-1], out_totals[:-1]
+        out_dates = np.concatenate([out_dates, tail_dates])
+        out_totals = np.concatenate([out_totals, tail_totals])
+    else:
+        out_dates, out_totals = _per_date(dates, values, running_total)
+
+    with _lock:
+        _series[name] = {'version': version, 'source_dates': dates, 'source_values': values,
+                         'dates': out_dates, 'totals': out_totals}
+    return out_dates, out_totals
+
+
+def _total_at(dates, totals, when):
+    """Total reached at each of the given dates (0 before the first one)."""
+    index = np.searchsorted(dates, when, side='right') - 1
+    return np.where(index >= 0, totals[np.maximum(index, 0)], 0)
+
+
+def cumulative_timeline(df_stock, df_historial):
+    """
+    Assembled (UMD_number) and installed (cumulative_installations) totals at
+    every date where one of them changes, built once per data version.
+    """
+    key = (frame_version(df_stock), frame_version(df_historial))
+    with _lock:
+        if None not in key and _combined.get('key') == key:
+            return _combined['frame']
+
+    stock = df_stock.sort_values('date', kind='stable')
+    stock_dates, assembled = cumulative_series('stats_stock', stock['date'].values, stock['UMD_number'].values,
+                                               key[0], running_total=False)
+    install_dates, installed = cumulative_series('stats_historial', df_historial['install_date'].values,
+                                                 df_historial['modules_installed'].values, key[1], running_total=True)
+
+    dates = np.union1d(stock_dates, install_dates)
+    frame = pd.DataFrame({
+        'date': dates,
+        'UMD_number': _total_at(stock_dates, assembled, dates),
+        'cumulative_installations': _total_at(install_dates, installed, dates),
+    })
+    with _lock:
+        _combined.update(key=key, frame=frame)
+    return frame
+
+
+def quarter_ranges(start, end):
+    """(start, end) of every calendar quarter from start to end, keyed like 'Q1 2024'."""
+    quarters = pd.period_range(pd.Timestamp(start), pd.Timestamp(end), freq='Q')
+    return {f"Q{q.quarter} {q.year}": (q.start_time, q.end_time.normalize()) for q in quarters}
+
+
+def period_metrics(df_stock, df_historial, periods):
+    """
+    Assembled, installed and new-position deltas of many periods at once.
+    periods maps a name to (start, end, relative): fixed periods include both
+    days; relative ones ("Last Month") count what happened after start, and
+    their assembled delta is measured from start to the overall maximum.
+    Returns a frame indexed by period name.
+    """
+    names = list(periods)
+    starts = np.array([np.datetime64(pd.Timestamp(periods[n][0]), 'ns') for n in names], dtype='datetime64[ns]')
+    ends = np.array([np.datetime64(pd.Timestamp(periods[n][1]), 'ns') if periods[n][1] is not None
+                     else np.datetime64('NaT') for n in names], dtype='datetime64[ns]')
+    relative = np.array([bool(periods[n][2]) for n in names], dtype=bool)
+
+    # Assembled: UMD_number is a running count, compare the period maximum to the previous one
+    stock = df_stock.sort_values('date', kind='stable')
+    stock_dates = stock['date'].values.astype('datetime64[ns]')
+    stock_values = stock['UMD_number'].values.astype(float)
+    lo = np.where(relative, np.searchsorted(stock_dates, starts, side='right'),
+                  np.searchsorted(stock_dates, starts, side='left'))
+    hi = np.where(relative, len(stock_dates), np.searchsorted(stock_dates, ends, side='right'))
+    hi = np.maximum(hi, lo)  # An end before the start is an empty period
+    rows = np.arange(len(stock_dates))
+    in_period = (rows >= lo[:, None]) & (rows < hi[:, None])
+    period_max = np.where(in_period, stock_values, -np.inf).max(axis=1, initial=-np.inf)
+    running_max = np.maximum.accumulate(stock_values) if len(stock_values) else stock_values
+    previous_max = np.where(lo > 0, running_max[np.maximum(lo - 1, 0)] if len(stock_values) else np.nan, np.nan)
+    has_period = hi > lo
+    assembled = np.where(has_period & (lo > 0), period_max - previous_max,
+                         np.where(has_period, period_max, 0.0))
+    overall_max = stock_values.max() if len(stock_values) else np.nan
+    assembled = np.where(relative, overall_max - previous_max, assembled)
+
+    # Installed: difference of the running sum of modules at the period bounds
+    order = np.argsort(df_historial['install_date'].values, kind='stable')
+    install_dates = df_historial['install_date'].values[order].astype('datetime64[ns]')
+    running_sum = np.concatenate([[0], np.cumsum(df_historial['modules_installed'].values[order])])
+    lo = np.where(relative, np.searchsorted(install_dates, starts, side='right'),
+                  np.searchsorted(install_dates, starts, side='left'))
+    hi = np.where(relative, len(install_dates), np.searchsorted(install_dates, ends, side='right'))
+    hi = np.maximum(hi, lo)
+    installed = running_sum[hi] - running_sum[lo]
+
+    # Positions: a row counts if its position did not appear earlier in the same period
+    codes = pd.factorize(df_historial['position'].values[order])[0]
+    rows = np.arange(len(codes))
+    previous = np.full(len(codes), -1)
+    by_code = np.lexsort((rows, codes))
+    same = np.flatnonzero(codes[by_code][1:] == codes[by_code][:-1])
+    previous[by_code[same + 1]] = by_code[same]
+    first_in_period = (rows >= lo[:, None]) & (rows < hi[:, None]) & (previous < lo[:, None]) & (codes >= 0)
+    positions = first_in_period.sum(axis=1)
+
+    return pd.DataFrame({
+        'start': starts,
+        'end': ends,
+        'assembled': assembled,
+        'installed': installed,
+        'positions': positions,
+    }, index=names)
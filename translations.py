@@ -255,4 +255,108 @@ lang_content = {
         'es': "Switch to English",
         'en': "Cambiar a Español"
     },
+    'refresh_data': {
+        'es': "Actualizar datos",
+        'en': "Refresh data"
+    },
+    'loading_data': {
+        'es': "Cargando datos...",
+        'en': "Loading data..."
+    },
+    'data_as_of': {
+        'es': "Datos al {}",
+        'en': "Data as of {}"
+    },
+    'data_refreshing': {
+        'es': "actualizando...",
+        'en': "refreshing..."
+    },
+    'data_stale': {
+        'es': "No se pudo conectar con Google Sheets. Se muestran los datos guardados al {}.",
+        'en': "Could not reach Google Sheets. Showing saved data as of {}."
+    },
+    'fuzzy_search': {
+        'es': "Búsqueda aproximada (ignora acentos y errores de tipeo)",
+        'en': "Fuzzy search (ignores accents and typos)"
+    },
+    'search_help': {
+        'es': "Busca texto en todas las columnas. También acepta filtros como `position:Kathy`, `after:2024-01-01`, `before:2024-12-31` y \"texto exacto\". Campos: {}",
+        'en': "Searches text in every column. Also accepts filters such as `position:Kathy`, `after:2024-01-01`, `before:2024-12-31` and \"exact text\". Fields: {}"
+    },
+    'query_invalid': {
+        'es': "No se pudo interpretar: {}",
+        'en': "Could not understand: {}"
+    },
+    'page_size': {
+        'es': "Filas por página",
+        'en': "Rows per page"
+    },
+    'page_number': {
+        'es': "Página (de {})",
+        'en': "Page (of {})"
+    },
+    'showing_rows': {
+        'es': "Mostrando {}–{} de {} reportes",
+        'en': "Showing {}–{} of {} reports"
+    },
+    'enlarge_photo': {
+        'es': "🔍 Ampliar",
+        'en': "🔍 Enlarge"
+    },
+    'prefetch_photos': {
+        'es': "Precargar las fotos de los primeros reportes",
+        'en': "Preload photos of the first reports"
+    },
+    'gallery_view': {
+        'es': "Galería de fotos",
+        'en': "Photo gallery"
+    },
+    'gallery_header': {
+        'es': "Galería",
+        'en': "Gallery"
+    },
+    'gallery_count': {
+        'es': "{} fotos en los reportes filtrados",
+        'en': "{} photos in the filtered reports"
+    },
+    'tab_validation_title': {
+        'es': "Validación de instalaciones",
+        'en': "Installation validation"
+    },
+    'validation_caption': {
+        'es': "Módulos que se superponen con otro módulo, invaden el tanque (3,6 m), salen del margen (13,6 m) o tienen ángulos ilegibles.",
+        'en': "Modules overlapping another module, intruding on the tank (3.6 m), reaching past the margin (13.6 m) or with unreadable angles."
+    },
+    'validation_overlap': {
+        'es': "Superposición",
+        'en': "Overlap"
+    },
+    'validation_tank': {
+        'es': "Invade el tanque",
+        'en': "Intrudes on tank"
+    },
+    'validation_outside': {
+        'es': "Fuera del margen",
+        'en': "Outside margin"
+    },
+    'validation_unparsable': {
+        'es': "Ángulos ilegibles",
+        'en': "Unreadable angles"
+    },
+    'validation_distance': {
+        'es': "Distancia máxima",
+        'en': "Max distance"
+    },
+    'validation_ok': {
+        'es': "No se encontraron problemas en las instalaciones.",
+        'en': "No problems found in the installations."
+    },
+    'stats_quarter_table': {
+        'es': "Comparación por trimestre",
+        'en': "Quarter by quarter"
+    },
+    'install_date_label': {
+        'es': "Fecha de instalación",
+        'en': "Install date"
+    },
 }
\ No newline at end of file
@@ -1,42 +1,54 @@
 import pandas as pd
 import streamlit as st
-import requests
-from PIL import Image
-import io
 import re
+import threading
+from functools import lru_cache
+from cachetools import LRUCache
 from translations import lang_content as translations
 import plotly.graph_objects as go
 import numpy as np
+from search_index import get_search_index, search_index, fuzzy_search_index
+from snapshots import frame_hash
+from data_loader import frame_version
+from photo_cache import get_photo_bytes, display_photo
+from geometry import get_geometry, MODULES, TANK_DIAMETER, MARGIN_DIAMETER
 
 
 def search_dataframe(df, query):
     """
     Search through all columns of a dataframe for a query string.
+    Every whitespace-separated term (or "quoted text") must appear in the row,
+    case-insensitively. Queries are answered from an inverted index built once
+    per dataset version (the content hash of the sheet).
     Returns a boolean mask of matching rows.
     """
     if not query:
-        return pd.Series([True] * len(df))
-    
-    mask = pd.Series([False] * len(df))
-    for column in df.columns:
-        # Convert column to string and search
-        mask |= df[column].astype(str).str.contains(query, case=False, na=False)
-    return mask
+        return pd.Series(True, index=df.index)
+
+    version = frame_version(df) or frame_hash(df)
+    index = get_search_index(df, version)
+    return pd.Series(search_index(index, query), index=df.index)
+
+def fuzzy_search_dataframe(df, query):
+    """
+    Accent- and case-insensitive search tolerant to typos.
+    Returns a Series with the relevance score of every row (0 for rows that
+    do not match), to filter with `scores > 0` and rank the results.
+    """
+    if not query:
+        return pd.Series(1.0, index=df.index)
+
+    version = frame_version(df) or frame_hash(df)
+    index = get_search_index(df, version)
+    return pd.Series(fuzzy_search_index(index, query), index=df.index)
 
 def switch_language():
     """Switch between English and Spanish languages"""
     st.session_state['language'] = 'en' if st.session_state['language'] == 'es' else 'es'
 
-# Function to get image content from Google Drive link
-def get_image_content(drive_link):
-    clean_link = clean_url(drive_link)
-    file_id = clean_link.split('=')[-1]
-    url = f"https://drive.google.com/uc?export=view&id={file_id}"
-    response = requests.get(url, stream=True)
-    if response.status_code == 404:
-        raise Exception("Image not found. It may have been deleted or is not publicly accessible.")
-    response.raise_for_status()
-    return Image.open(io.BytesIO(response.content))
+# Photo of a report ready for st.image, decoded only if the browser cannot show the original
+def get_report_photo(drive_link):
+    return display_photo(get_photo_bytes(clean_url(drive_link)))
 
 # Function to clean up the URL
 def clean_url(url):
@@ -151,6 +163,78 @@ scintillator_mapping = {
     for scint, fpga, datos in zip(num_scintillator, num_canalFPGA, num_canaldatos)
 }
 
+@lru_cache(maxsize=None)
+def _umd_layout_base():
+    """
+    Figure with the 64 scintillator strips of a UMD module drawn as a single
+    bar trace, and the scintillator number of every bar. Built once.
+    """
+    umd_width = 1.28
+    scint_count = 32
+    scint_width = umd_width / scint_count
+    scint_length = 0.5
+    scint_offset = 0.25
+
+    # Top strips numbered 1-32 from left to right, bottom strips 64-33
+    left = np.linspace(-umd_width/2, umd_width/2 - scint_width, scint_count)
+    x = np.concatenate([left, left]) + scint_width / 2
+    base = np.repeat([scint_offset, -scint_offset - scint_length], scint_count)
+    numbers = np.concatenate([np.arange(1, 33), np.arange(64, 32, -1)])
+    hovertext = [f"Scintillator: {n}<br>FPGA Channel: {scintillator_mapping[n]['fpga']}<br>Data Channel: {scintillator_mapping[n]['datos']}"
+                 for n in numbers]
+
+    fig = go.Figure(go.Bar(
+        x=x,
+        y=np.full(len(numbers), scint_length),
+        base=base,
+        width=scint_width,
+        marker=dict(color="white", line=dict(color="Black", width=1)),
+        hoverinfo="text",
+        hovertext=hovertext,
+        showlegend=False
+    ))
+
+    # Add central circle
+    fig.add_shape(
+        type="circle",
+        xref="x",
+        yref="y",
+        x0=-0.15,
+        y0=-0.15,
+        x1=0.15,
+        y1=0.15,
+        fillcolor="lightblue",
+        opacity=0.7
+    )
+
+    fig.update_layout(
+        xaxis=dict(
+            scaleanchor="y",
+            scaleratio=1,
+            showgrid=False,
+            zeroline=False,
+            showticklabels=False
+        ),
+        yaxis=dict(
+            showgrid=False,
+            zeroline=False,
+            showticklabels=False
+        ),
+        width=600,
+        height=800,
+        showlegend=False,
+        hovermode='closest'
+    )
+    return fig, numbers
+
+
+def create_umd_layout_plot(problematic_scints):
+    """UMD module layout with the problematic scintillators in red."""
+    base, numbers = _umd_layout_base()
+    fig = go.Figure(base)
+    fig.update_traces(marker_color=np.where(np.isin(numbers, list(problematic_scints)), "red", "white"))
+    return fig
+
 def check_login():
     """
     Check if user is logged in and redirect to home page if not.
@@ -161,133 +245,136 @@ def check_login():
         return False
     return True
 
-def create_umd_position_plot(umd_info, selected_umd):
-    try:
-        # Constants
-        circle_diameter = 3.6  # meters
-        margin_diameter = 13.6  # meters
-        umd_width = 1.4  # meters
-        umd_height = 9.0  # meters
-
-        # Create figure
-        fig = go.Figure()
-
-        # Add central circle (tank)
-        theta = np.linspace(0, 2*np.pi, 100)
-        x_circle = (circle_diameter/2) * np.cos(theta)
-        y_circle = (circle_diameter/2) * np.sin(theta)
-        fig.add_trace(go.Scatter(
-            x=x_circle, y=y_circle,
-            fill="toself",
-            fillcolor="rgba(255,200,200,0.5)",
-            line=dict(color="rgba(255,200,200,0.8)"),
-            name="Tank"
-        ))
+def keep_selection(key):
+    """
+    Keep the value of a dropdown whose labels changed (facet counts): new
+    labels give the widget a new id, which would otherwise reset it.
+    """
+    if st.session_state.get(key) is not None:
+        st.session_state[key] = st.session_state[key]
 
-        # Add margin circle
-        x_margin = (margin_diameter/2) * np.cos(theta)
-        y_margin = (margin_diameter/2) * np.sin(theta)
-        fig.add_trace(go.Scatter(
-            x=x_margin, y=y_margin,
-            line=dict(color="rgba(200,200,200,0.5)"),
-            name="Margin"
-        ))
+# Tank and margin outlines of the position plot
+_theta = np.linspace(0, 2*np.pi, 100)
+_position_figures = LRUCache(maxsize=64)
+_position_lock = threading.Lock()
+
+
+def create_umd_position_plot(df_historial, position, selected_umd):
+    """
+    Plot the modules of an installation (a row position in the installation
+    history) around the tank, highlighting the selected UMD. Figures are
+    cached per (dataset version, installation, selected UMD) and must not be
+    modified. Returns None if a module has unparsable angles.
+    """
+    version = frame_version(df_historial)
+    key = (version, position, selected_umd)
+    with _position_lock:
+        fig = _position_figures.get(key)
+    if fig is None:
+        fig = _build_umd_position_plot(df_historial, get_geometry(df_historial, version), position, selected_umd)
+        if version is not None:
+            with _position_lock:
+                _position_figures[key] = fig
+    return fig
+
+
+def _build_umd_position_plot(df_historial, geometry, i, selected_umd):
+    present = geometry['present'][i]
+    if not geometry['parsed'][i][present].all():
+        print(f"Error creating plot: unparsable angles for installation {df_historial['position'].iloc[i]}")
+        return None
+
+    umd_info = df_historial.iloc[i]
+
+    # Create figure
+    fig = go.Figure()
 
-        # Add UMDs
-        for module in ['101', '102', '103']:
-            # Skip if module ID is "-"
-            if umd_info[f'id_m{module}'] == "-":
-                continue
-
-            rd = float(str(umd_info[f'RadioDistance_m{module}']).replace(',', '.'))
-            pa = np.radians(float(str(umd_info[f'PositionAngle_m{module}']).replace(',', '.')))
-            ra = np.radians(float(str(umd_info[f'RotationAngle_m{module}']).replace(',', '.')))
-
-            # Calculate center position
-            x = -rd * np.sin(pa)
-            y = -rd * np.cos(pa)
-
-            # Create rectangle corners (rotated)
-            corners_x = []
-            corners_y = []
-
-            # Calculate corners of rectangle
-            for dx, dy in [(-umd_width/2, -umd_height/2), 
-                        (umd_width/2, -umd_height/2),
-                        (umd_width/2, umd_height/2),
-                        (-umd_width/2, umd_height/2),
-                        (-umd_width/2, -umd_height/2)]:  # Close the shape
-                # Rotate point by RA
-                rx = -dx * np.cos(ra) - dy * np.sin(ra)
-                ry = dx * np.sin(ra) - dy * np.cos(ra)
-                # Translate to position
-                corners_x.append(x + rx)
-                corners_y.append(y + ry)
-
-            # Set color based on whether this is the selected UMD
-            is_selected = umd_info[f'id_m{module}'] == selected_umd
-            fillcolor = "rgba(255,255,255,0.8)" if is_selected else "rgba(200,200,255,0.5)"
-            line_width = 2 if is_selected else 1
-
-            # Add UMD rectangle
-            fig.add_trace(go.Scatter(
-                x=corners_x, y=corners_y,
-                fill="toself",
-                fillcolor=fillcolor,
-                line=dict(color="black", width=line_width),
-                name=f"UMD {umd_info[f'id_m{module}']}",
-                hovertext=f"UMD {umd_info[f'id_m{module}']}<br>RD: {rd}m<br>PA: {umd_info[f'PositionAngle_m{module}']}°<br>RA: {umd_info[f'RotationAngle_m{module}']}°",
-                showlegend=False
-            ))
-
-            fig.add_shape(
-                type="circle",
-                xref="x",
-                yref="y",
-                x0=x-0.3,
-                y0=y-0.3,
-                x1=x+0.3,
-                y1=y+0.3,
-                fillcolor="lightblue",
-                opacity=0.7
-            )
-
-        # Add North indicator
+    # Add central circle (tank)
+    fig.add_trace(go.Scatter(
+        x=(TANK_DIAMETER/2) * np.cos(_theta), y=(TANK_DIAMETER/2) * np.sin(_theta),
+        fill="toself",
+        fillcolor="rgba(255,200,200,0.5)",
+        line=dict(color="rgba(255,200,200,0.8)"),
+        name="Tank"
+    ))
+
+    # Add margin circle
+    fig.add_trace(go.Scatter(
+        x=(MARGIN_DIAMETER/2) * np.cos(_theta), y=(MARGIN_DIAMETER/2) * np.sin(_theta),
+        line=dict(color="rgba(200,200,200,0.5)"),
+        name="Margin"
+    ))
+
+    # Add UMDs from the precomputed footprints
+    for j, module in enumerate(MODULES):
+        if not present[j]:
+            continue
+
+        umd_id = geometry['ids'][i, j]
+        x, y = geometry['centers'][i, j]
+        corners = geometry['corners'][i, j]
+
+        # Set color based on whether this is the selected UMD
+        is_selected = umd_id == selected_umd
+        fillcolor = "rgba(255,255,255,0.8)" if is_selected else "rgba(200,200,255,0.5)"
+        line_width = 2 if is_selected else 1
+
+        # Add UMD rectangle
         fig.add_trace(go.Scatter(
-            x=[0, 0],
-            y=[circle_diameter/2 + 0.5, circle_diameter/2 + 1.5],
-            mode='lines',
-            line=dict(color="gray"),
-            name="North"
+            x=corners[:, 0], y=corners[:, 1],
+            fill="toself",
+            fillcolor=fillcolor,
+            line=dict(color="black", width=line_width),
+            name=f"UMD {umd_id}",
+            hovertext=f"UMD {umd_id}<br>RD: {geometry['rd'][i, j]}m<br>PA: {umd_info[f'PositionAngle_m{module}']}°<br>RA: {umd_info[f'RotationAngle_m{module}']}°",
+            showlegend=False
         ))
-        fig.add_annotation(
-            x=0, y=circle_diameter/2 + 2,
-            text="N",
-            showarrow=False,
-            font=dict(size=14)
-        )
 
-        # Update layout
-        fig.update_layout(
-            showlegend=True,
-            width=600,
-            height=800,
-            xaxis=dict(
-                scaleanchor="y",
-                scaleratio=1,
-                showgrid=False,
-                zeroline=False,
-                showticklabels=False
-            ),
-            yaxis=dict(
-                showgrid=False,
-                zeroline=False,
-                showticklabels=False
-            ),
-            hovermode='closest'
+        fig.add_shape(
+            type="circle",
+            xref="x",
+            yref="y",
+            x0=x-0.3,
+            y0=y-0.3,
+            x1=x+0.3,
+            y1=y+0.3,
+            fillcolor="lightblue",
+            opacity=0.7
         )
 
-        return fig
-    except Exception as e:
-        print(f"Error creating plot: {str(e)}")
-        return None
\ No newline at end of file
+    # Add North indicator
+    fig.add_trace(go.Scatter(
+        x=[0, 0],
+        y=[TANK_DIAMETER/2 + 0.5, TANK_DIAMETER/2 + 1.5],
+        mode='lines',
+        line=dict(color="gray"),
+        name="North"
+    ))
+    fig.add_annotation(
+        x=0, y=TANK_DIAMETER/2 + 2,
+        text="N",
+        showarrow=False,
+        font=dict(size=14)
+    )
+
+    # Update layout
+    fig.update_layout(
+        showlegend=True,
+        width=600,
+        height=800,
+        xaxis=dict(
+            scaleanchor="y",
+            scaleratio=1,
+            showgrid=False,
+            zeroline=False,
+            showticklabels=False
+        ),
+        yaxis=dict(
+            showgrid=False,
+            zeroline=False,
+            showticklabels=False
+        ),
+        hovermode='closest'
+    )
+
+    return fig